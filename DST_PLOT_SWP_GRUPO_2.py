@@ -1,13 +1,24 @@
 import requests
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import time
-import re
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+
+from dst_parser import parse_dst_request
+import dst_store
+import figure_templates
+import http_cache
+import metrics
+import output_pipeline
+import render_cache
+import retry
 
 #========================================================================================
 RUTA_GUARDADO = "DST_GAMONAL_SWP.png"  # Especifica la ruta completa aquí
+DIAS_VENTANA = 5  # Durante los primeros días del mes se grafican los últimos N días
+# Bandas de intensidad: (límite superior, límite inferior, color, etiqueta)
+BANDAS_DST = [(-30, -50, 'yellow', 'Débil (-30 a -50 nT)'),
+              (-50, -100, 'orange', 'Moderada (-50 a -100 nT)'),
+              (-100, -250, 'green', 'Intensa (-100 a -250 nT)'),
+              (-250, -350, 'red', 'Muy Intensa (< -250 nT)')]
 #========================================================================================
 
 # Diccionario para mapear números de meses a nombres de meses
@@ -17,165 +28,151 @@ month_names = {
     '09': 'Septiembre', '10': 'Octubre', '11': 'Noviembre', '12': 'Diciembre'
 }
 
-def update_data():
-    print("Iniciando la función update_data")
-
-    # Obtener el mes y el año actuales
-    try:
-        now = datetime.now()
-        year = now.year
-        month = now.month
-        day = now.day
-        month_str = str(month).zfill(2)
-    except Exception as e:
-        print(f"Error obteniendo fecha actual: {e}. Reintentando en 1 minuto.")
-        time.sleep(60)
-        return
-
-    # Verificación previa para evitar fallos en los primeros días del mes
-    if day < 5:
-        print("Los datos aún no están disponibles para este mes. Intente nuevamente más tarde.")
-        return
+def month_url(year, month):
+    month_str = str(month).zfill(2)
+    return f'https://wdc.kugi.kyoto-u.ac.jp/dst_realtime/{year}{month_str}/dst{year % 100:02d}{month_str}.for.request'
 
-    # URL del archivo
-    url = f'https://wdc.kugi.kyoto-u.ac.jp/dst_realtime/{year}{month_str}/dst{year % 100}{month_str}.for.request'
+def fetch_month(year, month):
+    """Descarga un mes y lo incorpora al archivo local. Retorna las horas que cambiaron o None si falló."""
+    url = month_url(year, month)
     print(f"URL generada: {url}")
 
-    # Intentar descargar el archivo con manejo de excepciones
+    # Intentar descargar el archivo con manejo de excepciones (revalidando contra la caché)
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()  # Lanza excepción si la respuesta no es 200 OK
+        with metrics.stage('fetch'):
+            response = retry.call(http_cache.fetch, url, url=url)
         print("Datos descargados correctamente")
     except requests.exceptions.RequestException as e:
         print(f"Error al intentar conectar con {url}: {e}")
-        print("Reintentando en 5 minutos...")
-        time.sleep(300)
-        return
+        print("Se reintentará en la próxima ejecución.")
+        return None
+
+    # Camino rápido: el archivo no cambió desde la última ejecución y ya está en el archivo local
+    if not response.modified and f'{year:04d}-{month:02d}' in dst_store.load_index():
+        print(f"Sin cambios en {year}-{month:02d}")
+        return 0
 
     # Verificación del contenido descargado
     if response.content.strip() == b'':  # Revisa si el archivo está vacío
         print("El archivo descargado está vacío. Reintentando en 1 hora.")
-        return
+        return None
 
-    # Guardar el archivo descargado
-    filename = f'dst{year % 100}{month_str}.for.request'
+    # Decodificar (formato de ancho fijo WDC) e incorporar al archivo local
     try:
-        with open(filename, 'wb') as file:
-            file.write(response.content)
-            print(f"Archivo guardado como: {filename}")
+        with metrics.stage('parse'):
+            fechas, horas, promedios, versiones = parse_dst_request(response.content)
+            cambios = dst_store.upsert_days(fechas, horas, versiones)
+        print(f"Horas nuevas o revisadas en {year}-{month:02d}: {cambios}")
+        return cambios
     except Exception as e:
-        print(f"Error guardando el archivo: {e}")
+        print(f"Error procesando los datos: {e}")
+        http_cache.invalidate(url)
+        return None
+
+def plot_window(inicio, fin, titulo, ruta=RUTA_GUARDADO):
+    """Grafica el Dst horario de [inicio, fin) leído directamente del archivo local."""
+    with metrics.stage('subset'):
+        tiempos, valores = dst_store.read_window(inicio, fin)
+
+    # Si los datos y parámetros son los mismos del último gráfico, no se vuelve a renderizar
+    clave = render_cache.render_key([valores], inicio=tiempos[0], titulo=titulo, dpi=300, figsize=(10, 6))
+    if render_cache.is_fresh(ruta, clave):
+        print("Datos sin cambios; no se regenera el gráfico.")
         return
 
-    # Leer el contenido del archivo
-    try:
-        with open(filename, 'r') as file:
-            data = file.readlines()
+    flattened_list = valores.astype(float).filled(np.nan)
+    nan_count = int(np.isnan(flattened_list).sum())
+    print(f"Cantidad de valores NaN en los datos: {nan_count}")
+    metrics.increment('valores_nan', nan_count)
+    with metrics.stage('render'), render_cache.PYPLOT_LOCK:
+        _draw(tiempos, flattened_list, titulo, ruta)
+    render_cache.record(ruta, clave)
+
+def _dst_background(fig, ax):
+    """Parte estática del gráfico Dst: bandas de intensidad, ejes, grilla y leyenda."""
+    from matplotlib.lines import Line2D
+
+    # Colorear las áreas correspondientes a diferentes niveles de tormentas geomagnéticas
+    bandas = [ax.axhspan(inferior, superior, color=color, alpha=0.3, label=etiqueta)
+              for superior, inferior, color, etiqueta in BANDAS_DST]
+
+    ax.set_xlabel('Días', fontsize=12)
+    ax.set_ylabel('Índice Dst (nT)', fontsize=12)
+    ax.grid(True, which='both', linestyle='--', linewidth=0.5)
+    fig.subplots_adjust(top=0.880, bottom=0.110, left=0.085, right=0.975, hspace=0.200, wspace=0.200)
+    ax.legend(handles=[Line2D([], [], color='black', label='Dst')] + bandas, loc='lower left',
+              bbox_to_anchor=(0, 0), fancybox=True, shadow=True, prop={'size': 8})
+    ax.set_ylim([-350, 100])
+
+def _draw(tiempos, flattened_list, titulo, ruta):
+    """Dibuja la curva Dst sobre la plantilla (bandas y leyenda ya hechas) y la guarda."""
+    plantilla = figure_templates.get_template('dst', _dst_background, (10, 6), 300)
+    figure_templates.clear_data(plantilla)
+    ax = plantilla.ax
+
+    # Rango de horas en el eje x
+    days = np.arange(1, len(flattened_list) + 1)
+
+    # Graficar la curva Dst
+    linea, = ax.plot(days, flattened_list, color='black', label='Dst')
+    figure_templates.add_data(plantilla, linea)
+
+    ax.set_title(titulo, fontsize=14, fontweight='bold')
+
+    # Un tick al inicio de cada día, rotulado con el día del mes
+    tick_positions = np.flatnonzero(tiempos.astype('datetime64[D]') == tiempos)
+    tick_labels = (tiempos[tick_positions].astype('datetime64[D]')
+                   - tiempos[tick_positions].astype('datetime64[M]')).astype(int) + 1
+    ax.set_xticks(tick_positions, tick_labels)
+    ax.set_xlim(0, len(days) + 1)
+
+    # Guardar la gráfica (PNG completo, versión web y miniatura de un solo render)
+    output_pipeline.save_figure(plantilla.fig, ruta, dpi=300, bbox_inches='tight')
+
+@metrics.job('dst')
+def update_data():
+    """Actualiza el archivo local y el gráfico. Retorna True si todo salió bien."""
+    print("Iniciando la función update_data")
 
-        # Eliminar la última línea si contiene solo texto
-        if 'Created at' in data[-1]:
-            data = data[:-1]
+    # Obtener el mes y el año actuales (UT, como los datos de Kyoto)
+    try:
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        year = now.year
+        month = now.month
+        day = now.day
+        month_str = str(month).zfill(2)
     except Exception as e:
-        print(f"Error leyendo el archivo: {e}")
-        return
-
-    # Expresión regular para detectar números
-    number_pattern = re.compile(r'-?\d+')
+        print(f"Error obteniendo fecha actual: {e}")
+        return False
+
+    inicio_mes = datetime(year, month, 1)
+    if day < DIAS_VENTANA:
+        # Primeros días del mes: la ventana cruza al mes anterior, que se completa si hace falta
+        inicio = now.replace(minute=0, second=0, microsecond=0) - timedelta(days=DIAS_VENTANA)
+        fin = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        anterior = inicio_mes - timedelta(days=1)
+        if not dst_store.month_complete(anterior.year, anterior.month):
+            fetch_month(anterior.year, anterior.month)
+        titulo = f'Últimos {DIAS_VENTANA} días - {month_names[month_str]} {year}'
+    else:
+        inicio = inicio_mes
+        fin = datetime(year + month // 12, month % 12 + 1, 1)
+        titulo = f'{month_names[month_str]} - {year}'
+
+    # El mes en curso puede no estar publicado aún (primeras horas del día 1)
+    descargado = fetch_month(year, month) is not None
 
-    # Procesar los datos
+    # Graficar los datos
     try:
-        first_column = []
-        values = []
-
-        for line in data:
-            parts = number_pattern.findall(line)
-            if parts:
-                first_column.append(parts[0])  # La primera parte es el identificador
-                cleaned_values = []
-                for value in parts[1:]:
-                    try:
-                        val = int(value)
-                        # Detectar valores erróneos y reemplazarlos por NaN
-                        if val == 9999999999 or abs(val) > 999:
-                            cleaned_values.append(np.nan)
-                        else:
-                            cleaned_values.append(val)
-                    except ValueError:
-                        cleaned_values.append(np.nan)
-
-                if len(cleaned_values) > 3:
-                    cleaned_values = cleaned_values[3:-1]
-                else:
-                    cleaned_values = []
-
-                values.append(cleaned_values)
+        plot_window(inicio, fin, titulo)
     except Exception as e:
-        print(f"Error procesando los datos: {e}")
-        return
+        print(f"Error graficando los datos: {e}")
+        return False
+    return descargado
 
-    # Crear DataFrame
+if __name__ == "__main__":
+    # Llamada única a la función principal
     try:
-        max_length = max(len(lst) for lst in values) if values else 0
-        for lst in values:
-            while len(lst) < max_length:
-                lst.append(np.nan)
-
-        df = pd.DataFrame(values, columns=[f'Column {i+1}' for i in range(max_length)])
-
-        # Verificar el DataFrame procesado
-        print("DataFrame procesado completo:")
-        print(df)
+        update_data()
     except Exception as e:
-        print(f"Error creando el DataFrame: {e}")
-        return
-
-    # Graficar los datos
-    if not df.empty:
-        try:
-            flattened_list = [item for sublist in df.values.tolist() for item in sublist]
-            nan_count = np.isnan(flattened_list).sum()
-            print(f"Cantidad de valores NaN en los datos: {nan_count}")
-
-            # Rango de días en el eje x
-            days = np.arange(1, len(flattened_list) + 1)
-
-            plt.figure(figsize=(10, 6))  # Ajustar el tamaño de la figura
-
-            # Colorear las áreas correspondientes a diferentes niveles de tormentas geomagnéticas
-            plt.fill_between(days, -30, -50, color='yellow', alpha=0.3, label='Débil (-30 a -50 nT)')
-            plt.fill_between(days, -50, -100, color='orange', alpha=0.3, label='Moderada (-50 a -100 nT)')
-            plt.fill_between(days, -100, -250, color='green', alpha=0.3, label='Intensa (-100 a -250 nT)')
-            plt.fill_between(days, -250, -350, color='red', alpha=0.3, label='Muy Intensa (< -250 nT)')
-
-            # Graficar la curva Dst
-            plt.plot(days, flattened_list, color='black', label='Dst')
-
-            plt.title(f'{month_names[month_str]} - {year}', fontsize=14, fontweight='bold')
-            plt.xlabel('Días', fontsize=12)
-            plt.ylabel('Índice Dst (nT)', fontsize=12)
-
-            # Configurar los ticks en el eje X dinámicamente según el número de días
-            tick_positions = np.arange(0, len(flattened_list), 24)
-            tick_labels = np.arange(1, len(tick_positions) + 1)
-            plt.xticks(tick_positions, tick_labels)
-
-            plt.grid(True, which='both', linestyle='--', linewidth=0.5)
-
-            plt.subplots_adjust(top=0.880, bottom=0.110, left=0.085, right=0.975, hspace=0.200, wspace=0.200)
-
-            plt.legend(loc='lower left', bbox_to_anchor=(0, 0), fancybox=True, shadow=True, prop={'size': 8})
-
-            plt.xlim(0, len(days) + 1)
-            plt.ylim([-350, 100])
-
-            # Guardar la gráfica
-            plt.savefig(RUTA_GUARDADO, dpi=300, bbox_inches='tight')
-            plt.close()
-        except Exception as e:
-            print(f"Error graficando los datos: {e}")
-
-# Llamada única a la función principal
-try:
-    update_data()
-except Exception as e:
-    print(f"Ocurrió un error inesperado: {e}")
+        print(f"Ocurrió un error inesperado: {e}")
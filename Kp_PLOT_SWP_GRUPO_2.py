@@ -1,10 +1,16 @@
-import matplotlib.pyplot as plt
 import numpy as np
 from datetime import datetime, timedelta, timezone
 import json
-import urllib.request
 import time
 
+import requests
+
+import gfz_client
+import http_cache
+import metrics
+import render_cache
+import retry
+
 #===============================================
 # Ruta manual para guardar la imagen
 RUTA_GUARDADO = "KP_GAMONAL_SWP.png"  # Especifica la ruta completa aquí
@@ -26,13 +32,18 @@ meses_espanol = {
     12: 'Diciembre'
 }
 
+# Umbrales de severidad (Kp >= 5, 6, 7, 8, 9) y el color de cada tramo de np.digitize
+SEVERIDAD_UMBRALES = np.array([5, 6, 7, 8, 9])
+SEVERIDAD_COLORES = np.array(['blue', 'cyan', 'lightgreen', 'yellow', 'orange', 'red'])
+MAX_BARRAS = 2000  # Con más puntos se dibujan líneas verticales en lugar de barras
+
 def _checkdate(starttime, endtime):
     if starttime > endtime:
         raise NameError("Error! Start time must be before or equal to end time")
     return True
 
 def _checkIndex(index):
-    valid_indices = ['Kp', 'ap', 'Ap', 'Cp', 'C9', 'Hp30', 'Hp60', 'ap30', 'ap60', 'SN', 'Fobs', 'Fadj']
+    valid_indices = gfz_client.VALID_INDICES
     if index not in valid_indices:
         raise IndexError(f"Error! Wrong index parameter! \nAllowed are only the following: {', '.join(valid_indices)}")
     return True
@@ -73,15 +84,16 @@ def getKpindex(starttime, endtime, index, status='all'):
         if index not in ['Hp30', 'Hp60', 'ap30', 'ap60', 'Fobs', 'Fadj']:
             url = _addstatus(url, status)
 
-        # Realizar la solicitud HTTP con un timeout
+        # Realizar la solicitud HTTP con un timeout, revalidando contra la caché
         print(f"Conectando a la API: {url}")
-        webURL = urllib.request.urlopen(url, timeout=10)  # 10 segundos de tiempo máximo
-        binary = webURL.read()
-        text = binary.decode('utf-8')
+        with metrics.stage('fetch'):
+            response = retry.call(http_cache.fetch, url, timeout=10, url=url)  # 10 segundos por intento
+        text = response.content.decode('utf-8')
 
         try:
             # Procesar la respuesta JSON
-            data = json.loads(text)
+            with metrics.stage('parse'):
+                data = json.loads(text)
             result_t = data["datetime"]
             result_index = data[index]
             if index not in ['Hp30', 'Hp60', 'ap30', 'ap60', 'Fobs', 'Fadj']:
@@ -89,11 +101,14 @@ def getKpindex(starttime, endtime, index, status='all'):
             print(f"Número de puntos obtenidos: {len(result_t)}")
         except KeyError as e:
             print(f"KeyError: {e}. Response data: {data}")
+            http_cache.invalidate(url)
         except json.JSONDecodeError:
             print("Error decodificando la respuesta JSON. Verifica la respuesta de la API.")
+            http_cache.invalidate(url)
         except Exception as e:
             print(f"Error general procesando la respuesta JSON: {e}")
             print(text)
+            http_cache.invalidate(url)
 
     except NameError as er:
         print(f"Error en la validación de fecha: {er}")
@@ -102,33 +117,65 @@ def getKpindex(starttime, endtime, index, status='all'):
     except ValueError as e:
         print(f"Error! Formato de fecha incorrecto: {e}")
         print("Las fechas deben estar en el formato yyyy-mm-dd o yyyy-mm-ddTHH:MM:SSZ")
-    except urllib.error.URLError as e:
+    except requests.exceptions.RequestException as e:
         print(f"Error de conexión: {e}\nNo se pudo conectar a la URL {url}")
     except Exception as e:
         print(f"Error inesperado al obtener el índice Kp: {e}")
     finally:
         return result_t, result_index, result_s
 
-def plotKpIndex(time, index):
+def _kp_background(fig, ax2):
+    """Parte estática del gráfico Kp: bandas de severidad, leyenda y ejes."""
+    from matplotlib.patches import Patch
+
+    ax2.set_ylim(1, 10)
+    ax2.set_xlabel('Fecha (Día - Hora)', fontsize=14)
+
+    # Marcar los niveles de severidad
+    ax2.set_yticks(np.arange(0, 11, 1))
+    ax2.tick_params(axis='both', which='major', labelsize=12)
+
+    # Colorear las regiones por severidad
+    for umbral, color in zip(SEVERIDAD_UMBRALES, SEVERIDAD_COLORES[1:]):
+        ax2.axhspan(umbral, umbral + 1, color=color, alpha=0.3)
+
+    # Leyenda personalizada fuera de la gráfica (parte derecha)
+    legend_elements = [
+        Patch(facecolor='cyan', label='Menor (Kp = 5)'),
+        Patch(facecolor='lightgreen', label='Moderado (Kp = 6)'),
+        Patch(facecolor='yellow', label='Fuerte (Kp = 7)'),
+        Patch(facecolor='orange', label='Severo (Kp = 8)'),
+        Patch(facecolor='red', label='Extremo (Kp = 9)'),
+    ]
+    ax2.legend(handles=legend_elements, loc='center left', bbox_to_anchor=(1, 0.5), fontsize=12)
+
+    # Ajustar el diseño del gráfico
+    fig.subplots_adjust(right=0.75, left=0.07, bottom=0.17, top=0.943)
+
+def _parse_times(time):
+    """Convierte los instantes (texto ISO con 'Z' o datetime64) a datetime64[s] en bloque."""
+    time = np.asarray(time)
+    if np.issubdtype(time.dtype, np.datetime64):
+        return time.astype('datetime64[s]')
+    return np.char.rstrip(time.astype(str), 'Z').astype('datetime64[s]')
+
+def _tick_labels(fechas):
+    """Etiquetas 'DD - HH' solo para los instantes dados (los ticks visibles)."""
+    dias = fechas.astype('datetime64[D]')
+    dia_mes = (dias - fechas.astype('datetime64[M]')).astype(int) + 1
+    horas = (fechas - dias).astype('timedelta64[h]').astype(int)
+    return [f'{dia:02d} - {hora:02d}' for dia, hora in zip(dia_mes, horas)]
+
+@metrics.stage('render')
+def plotKpIndex(time, index, nombre='Kp'):
+    # 'nombre' es el índice graficado; debe estar en la escala Kp (Kp, Hp30, Hp60)
     try:
-        fechas_dt = [datetime.strptime(fecha, '%Y-%m-%dT%H:%M:%SZ') for fecha in time]
+        fechas = _parse_times(time)
+        index = np.asarray(index, dtype=float)
         d = np.arange(1, len(index) + 1)
 
-        # Asignar colores según el valor del índice
-        colors = []
-        for value in index:
-            if value >= 9:
-                colors.append('red')
-            elif value >= 8:
-                colors.append('orange')
-            elif value >= 7:
-                colors.append('yellow')
-            elif value >= 6:
-                colors.append('lightgreen')
-            elif value >= 5:
-                colors.append('cyan')
-            else:
-                colors.append('blue')
+        # Asignar colores según el valor del índice (umbrales de severidad)
+        colors = SEVERIDAD_COLORES[np.digitize(np.nan_to_num(index, nan=0.0), SEVERIDAD_UMBRALES)]
 
         # Título del gráfico con mes y año en español
         current_time = datetime.now()
@@ -136,74 +183,72 @@ def plotKpIndex(time, index):
         ano = current_time.year
         title = f'{mes} - {ano}'
 
-        # Crear el gráfico
-        fig, ax2 = plt.subplots(figsize=(10, 5))  # Cambiar las dimensiones del gráfico
-        barras = ax2.bar(d, index, width=0.6, color='black')
+        # Si los datos y parámetros son los mismos del último gráfico, no se vuelve a renderizar
+        clave = render_cache.render_key([fechas, index], title=title, nombre=nombre,
+                                        dpi=300, figsize=(10, 5))
+        if render_cache.is_fresh(RUTA_GUARDADO, clave):
+            print("Datos sin cambios; no se regenera el gráfico.")
+            return True
+
+        # Plantilla con la parte estática (bandas, leyenda, ejes); matplotlib se importa recién aquí
+        import figure_templates
+        import output_pipeline
+        plantilla = figure_templates.get_template('kp', _kp_background, (10, 5), 300)
+        figure_templates.clear_data(plantilla)
+        ax2 = plantilla.ax
+        if len(d) <= MAX_BARRAS:
+            barras = ax2.bar(d, index, width=0.6, color=colors)
+        else:
+            # Series largas (meses de Hp30): una sola colección de líneas en vez de un rectángulo por valor
+            barras = ax2.vlines(d, 0, index, colors=colors, linewidth=0.5)
+        figure_templates.add_data(plantilla, barras)
 
-        # Configuración de los ejes
-        ax2.set_xticks(np.arange(1, len(d) + 1, max(1, int(len(d) / 7))))
-        ax2.set_xticklabels([fecha.strftime('%d - %H') for fecha in fechas_dt][::max(1, int(len(d) / 7))], 
-                            ha='center', size=12)
+        # Configuración de los ejes: solo se formatean las etiquetas de los ticks visibles
+        paso = max(1, int(len(d) / 7))
+        ticks = np.arange(1, len(d) + 1, paso)
+        ax2.set_xticks(ticks)
+        ax2.set_xticklabels(_tick_labels(fechas[ticks - 1]), ha='center', size=12)
         ax2.set_xlim(1, len(d))
-        ax2.set_ylim(1, 10)
-        ax2.set_xlabel('Fecha (Día - Hora)', fontsize=14)
-        ax2.set_ylabel('Índice Kp', fontsize=14)
+        ax2.set_ylabel(f'Índice {nombre}', fontsize=14)
         ax2.set_title(title, fontsize=16)
 
-        # Marcar los niveles de severidad
-        ax2.set_yticks(np.arange(0, 11, 1))
-        ax2.tick_params(axis='both', which='major', labelsize=12)
-
-        # Colorear las regiones por severidad
-        ax2.fill_between(d, 5, 6, color='cyan', alpha=0.3)
-        ax2.fill_between(d, 6, 7, color='lightgreen', alpha=0.3)
-        ax2.fill_between(d, 7, 8, color='yellow', alpha=0.3)
-        ax2.fill_between(d, 8, 9, color='orange', alpha=0.3)
-        ax2.fill_between(d, 9, 10, color='red', alpha=0.3)
-
-        # Leyenda personalizada fuera de la gráfica (parte derecha)
-        from matplotlib.patches import Patch
-        legend_elements = [
-            Patch(facecolor='cyan', label='Menor (Kp = 5)'),
-            Patch(facecolor='lightgreen', label='Moderado (Kp = 6)'),
-            Patch(facecolor='yellow', label='Fuerte (Kp = 7)'),
-            Patch(facecolor='orange', label='Severo (Kp = 8)'),
-            Patch(facecolor='red', label='Extremo (Kp = 9)'),
-        ]
-        ax2.legend(handles=legend_elements, loc='center left', bbox_to_anchor=(1, 0.5), fontsize=12)
-
-        # Ajustar el diseño del gráfico
-        plt.tight_layout()
-        plt.subplots_adjust(right=0.75, left=0.07, bottom=0.17, top=0.943)
-
-        # Guardar el gráfico en un archivo
+        # Guardar el gráfico (PNG completo, versión web y miniatura de un solo render)
         try:
-            plt.savefig(RUTA_GUARDADO, dpi=300, bbox_inches='tight')
+            output_pipeline.save_figure(plantilla.fig, RUTA_GUARDADO, dpi=300, bbox_inches='tight')
+            render_cache.record(RUTA_GUARDADO, clave)
             print("Gráfico guardado exitosamente.")
+            return True
         except Exception as e:
             print(f"Error guardando el gráfico: {e}")
-        finally:
-            plt.close()
+            return False
     except Exception as e:
         print(f"Error durante la creación o el guardado del gráfico: {e}")
+        return False
 
+@metrics.job('kp')
 def update_and_plot():
+    """Obtiene el Kp y actualiza el gráfico. Retorna True si todo salió bien."""
     try:
         current_time = datetime.now(timezone.utc)
-        start_time = (current_time - timedelta(days=5)).strftime('%Y-%m-%dT%H:%M:%SZ')
-        end_time = current_time.strftime('%Y-%m-%dT%H:%M:%SZ')
+        start_time = current_time - timedelta(days=5)
 
-        # Obtener datos de Kp y graficarlos
+        # Obtener datos de Kp (solo se consulta lo que falta en la caché local) y graficarlos
         print("Obteniendo datos...")
-        time_data, index, status = getKpindex(start_time, end_time, 'Kp')
+        with metrics.stage('fetch'):
+            tiempos, valores = gfz_client.fetch_indices(['Kp'], start_time, current_time)['Kp']
+        print(f"Número de puntos obtenidos: {len(tiempos)}")
+        metrics.increment('valores_nan', int(np.isnan(valores).sum()))
 
-        if time_data and index:
+        if len(tiempos):
             print("Datos obtenidos. Generando gráfico...")
-            plotKpIndex(time_data, index)
+            with render_cache.PYPLOT_LOCK:
+                return plotKpIndex(tiempos, valores)
         else:
             print("No se recuperaron datos.")
+            return False
     except Exception as e:
         print(f"Error durante la actualización y graficado: {e}")
+        return False
 
 def main():
     try:
@@ -2,119 +2,273 @@ import requests
 from bs4 import BeautifulSoup
 import netCDF4 as nc
 import numpy as np
-import matplotlib.pyplot as plt
 import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-import cartopy.io.img_tiles as cimgt
 import matplotlib.lines as mlines
+from matplotlib.cm import ScalarMappable
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-import io
+import argparse
+import functools
+import multiprocessing
 import os
 
+import figure_templates
+import glm_backfill
+import glm_maps
+import glm_reader
+import http_cache
+import metrics
+import output_pipeline
+import render_cache
+import retry
+from swp_paths import data_dir
+
 #=============================================================================
 # RUTA DE GUARDADO DEL PLOT
 RUTA_GUARDADO = "./"
+RUTA_SALIDA = os.path.join(RUTA_GUARDADO, 'GLM_INPE_PLOT_SWP_GRUPO_3.png')
+REGIONES_SALIDA = ['peru']  # Un PNG por región; ver glm_reader.REGIONES
+DATOS = "flash"  # se puede cambiar a event o group
+MODO_GRAFICO = 'auto'  # 'puntos' (estrellas), 'densidad' (grilla) o 'auto'
+MIN_PUNTOS_DENSIDAD = 500  # En modo 'auto', con menos puntos se usan estrellas
+RESOLUCION_DENSIDAD = 0.1  # Tamaño de celda de la grilla de densidad (grados)
+PESO_DENSIDAD = 'duracion'  # 'duracion' (suma de duración), 'flash' (suma de flashes) o None (celdas)
+RENDER_EN_PROCESOS = True  # Con varias regiones: un proceso por región; False = una tras otra aquí
 #=============================================================================
 
-# Base URL del directorio que contiene los archivos
-base_url = "http://ftp.cptec.inpe.br/goes/goes16/goes16_web/glm_acumulado_nc/2025/"
+# Base URL del directorio que contiene los archivos (subdirectorios año/mes)
+base_url = "http://ftp.cptec.inpe.br/goes/goes16/goes16_web/glm_acumulado_nc/"
 
 def get_last_file_url(url):
-    retries = 3  # Número de reintentos en caso de error
-    for _ in range(retries):
-        try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            links = soup.find_all('a')
-            file_links = [link.get('href') for link in links if link.get('href').endswith('.nc')]
-            if file_links:
-                return url + file_links[-1]
-            else:
-                return None
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching URL {url}: {e}")
-    return None
+    """
+    Retorna (url del último archivo o None, True si el listado cambió desde la última consulta).
+    Si no se pudo obtener el listado, el segundo valor es None.
+    """
+    try:
+        response = retry.call(http_cache.fetch, url, timeout=10, url=url)
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching URL {url}: {e}")
+        return None, None
+    soup = BeautifulSoup(response.content, 'html.parser')
+    links = soup.find_all('a')
+    file_links = [link.get('href') for link in links if (link.get('href') or '').endswith('.nc')]
+    if file_links:
+        return url + file_links[-1], response.modified
+    else:
+        return None, response.modified
 
-def download_file_to_memory(url):
-    retries = 3  # Número de reintentos en caso de error
-    for _ in range(retries):
-        try:
-            response = requests.get(url, timeout=10)
-            if response.status_code == 200:
-                print(f"Archivo descargado exitosamente desde: {url}")
-                return io.BytesIO(response.content)  # Retorna el archivo en memoria
-            else:
-                print(f"Error al descargar el archivo: {response.status_code}")
-        except requests.exceptions.RequestException as e:
-            print(f"Error downloading file {url}: {e}")
-    print(f"Fallo al descargar el archivo después de {retries} intentos.")
+def download_file(url):
+    """
+    Descarga el .nc por bloques a ~/.cache/swp/glm/descargas y retorna su ruta (None si falla).
+
+    El archivo nunca se copia completo en memoria: netCDF4 lo abre desde disco y solo lee
+    la región pedida. Si la conexión se corta, los reintentos continúan desde el último byte.
+    El nombre es único por descarga (la animación puede estar bajando el mismo archivo);
+    quien llama lo borra después de leerlo.
+    """
+    try:
+        ruta = retry.download_temp(url, data_dir('glm', 'descargas'))
+        print(f"Archivo descargado exitosamente desde: {url}")
+        return ruta
+    except requests.exceptions.HTTPError as e:
+        print(f"Error al descargar el archivo: {e.response.status_code}")
+    except requests.exceptions.RequestException as e:
+        print(f"Error downloading file {url}: {e}")
+    print("Fallo al descargar el archivo.")
     return None
 
-try:
-    current_month = datetime.utcnow().month
-    formatted_month = f"{current_month:02}"
-    url = f"{base_url}{formatted_month}/"
-    last_file_url = get_last_file_url(url)
-    
-    if last_file_url:
-        file_memory = download_file_to_memory(last_file_url)
-        if file_memory is None:
-            print("No se pudo descargar el archivo.")
-            exit()
-
-        # Abrir el archivo NetCDF desde memoria
-        dataset = nc.Dataset('in-memory.nc', memory=file_memory.read())
-        file_name = last_file_url.split('/')[-1]
-        fecha = file_name[10:22]
-        fecha_datetime = datetime.strptime(fecha, '%Y%m%d%H%M')
-        fecha_datetime_peru = fecha_datetime - timedelta(hours=5)
-        fecha = str(fecha_datetime.date())
-        hora = str(fecha_datetime.time().strftime('%H:%M'))
-        hora_peru = str(fecha_datetime_peru.time().strftime('%H:%M'))
-
-        # Extraer datos
-        lat = dataset.variables['lat'][:]
-        lon = dataset.variables['lon'][:]
-        DATOS = "flash"  # se puede cambiar a event o group
-        flash_data = dataset.variables[DATOS][:]
-        lat_min, lat_max = -19.2, 0.7
-        lon_min, lon_max = -82.1, -68.10
-        lat_inds = np.where((lat >= lat_min) & (lat <= lat_max))[0]
-        lon_inds = np.where((lon >= lon_min) & (lon <= lon_max))[0]
-        flash_data_peru = flash_data[:, lat_inds, :][:, :, lon_inds]
-        flash_indices = np.where(flash_data_peru > 0)
-        flash_lats = lat[lat_inds][flash_indices[1]]
-        flash_lons = lon[lon_inds][flash_indices[2]]
-        flash_energy = dataset.variables['duration_flash'][:]
-        flash_energy_peru = flash_energy[:, lat_inds, :][:, :, lon_inds]
-        flash_energy_values = flash_energy_peru[flash_indices]
-        dataset.close()
-
-        # Definir caché de OpenStreetMap
-        cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'tiles')
-        os.makedirs(cache_dir, exist_ok=True)
-        osm_tiles = cimgt.OSM(cache=cache_dir)
-
-        # Graficar
-        fig, ax = plt.subplots(figsize=(10, 8), subplot_kw={'projection': ccrs.PlateCarree()})
-        ax.add_image(osm_tiles, 6)
-        ax.add_feature(cfeature.COASTLINE)
-        ax.add_feature(cfeature.BORDERS, linestyle=':')
-        ax.set_extent([lon_min, lon_max, lat_min, lat_max], crs=ccrs.PlateCarree())
-        sc = ax.scatter(flash_lons, flash_lats, c=flash_energy_values, marker='*', s=30, cmap='turbo', transform=ccrs.PlateCarree())
-        plt.colorbar(sc, label='Duración (segundos)', pad=0)
-        ax.text(0.47, 0.01, 'Fuente: CPTEC/INPE', fontsize=8, ha='left', va='bottom', transform=ax.transAxes)
-        plt.title(f'GLM - Acumulación de 5 minutos - {fecha}', fontweight='bold', fontsize=13)
-        ax.legend(handles=[
-            mlines.Line2D([], [], color='black', marker='*', linestyle='None', markersize=6, label='Flashes'),
-            mlines.Line2D([], [], color='none', marker='None', linestyle='None', label=f'Hora Perú: {hora_peru}'),
-            mlines.Line2D([], [], color='none', marker='None', linestyle='None', label=f'Hora GMT: {hora}')
-        ], loc='lower left')
-        plt.tight_layout()
-        plt.savefig('GLM_INPE_PLOT_SWP_GRUPO_3.png', dpi=300, bbox_inches='tight', pad_inches=0.1)
-        plt.close()
+def warm_up(regiones=None):
+    """Precarga las geometrías y teselas del mapa base de las regiones (ver glm_maps.warm_up)."""
+    glm_maps.warm_up(regiones or REGIONES_SALIDA)
+
+def output_path(region):
+    """Ruta del PNG de cada región; Perú conserva el nombre histórico."""
+    if region.nombre == 'peru':
+        return RUTA_SALIDA
+    return os.path.join(RUTA_GUARDADO, f'GLM_INPE_PLOT_SWP_GRUPO_3_{region.nombre}.png')
+
+def _glm_background(region, zoom, fig, ax):
+    """Parte estática del mapa: mapa base en raster, fuente y espacio de la barra de colores."""
+    extent = [region.lon_min, region.lon_max, region.lat_min, region.lat_max]
+    ancho = int(fig.get_figwidth() * fig.dpi)
+    fondo = figure_templates.basemap_raster(region, zoom, ancho)
+    ax.imshow(figure_templates.load_raster(fondo), extent=extent, origin='upper',
+              transform=ccrs.PlateCarree(), interpolation='bilinear')
+    ax.set_extent(extent, crs=ccrs.PlateCarree())
+    ax.text(0.47, 0.01, 'Fuente: CPTEC/INPE', fontsize=8, ha='left', va='bottom', transform=ax.transAxes)
+    barra = fig.colorbar(ScalarMappable(cmap='turbo'), ax=ax, pad=0)
+    fig.tight_layout()
+    return {'barra': barra}
+
+def plot_region(region, flash_lats, flash_lons, flash_energy_values, fecha, hora, hora_peru, ruta,
+                flash_counts=None, modo=MODO_GRAFICO):
+    """Renderiza el mapa de una región. Es una función de módulo para poder ejecutarse en un proceso aparte."""
+    lat_min, lat_max = region.lat_min, region.lat_max
+    lon_min, lon_max = region.lon_min, region.lon_max
+    zoom = glm_maps.zoom_level(region)
+    if modo == 'auto':
+        modo = 'densidad' if len(flash_lats) >= MIN_PUNTOS_DENSIDAD else 'puntos'
+
+    # Si los flashes y parámetros son los mismos del último mapa, no se vuelve a renderizar
+    # (los conteos entran en la clave cuando son los pesos de la grilla de densidad)
+    arreglos = [flash_lats, flash_lons, flash_energy_values]
+    if modo == 'densidad' and PESO_DENSIDAD == 'flash':
+        arreglos.append(flash_counts)
+    clave = render_cache.render_key(arreglos,
+                                    extent=[lon_min, lon_max, lat_min, lat_max], fecha=fecha,
+                                    hora=hora, zoom=zoom, dpi=300, figsize=(10, 8), modo=modo,
+                                    resolucion=RESOLUCION_DENSIDAD, peso=PESO_DENSIDAD)
+    if render_cache.is_fresh(ruta, clave):
+        print(f"Datos sin cambios para {region.nombre}; no se regenera el gráfico.")
+        return ruta
+
+    # Plantilla: mapa base (raster en caché), fuente y barra de colores se hacen una sola vez
+    extent = [lon_min, lon_max, lat_min, lat_max]
+    plantilla = figure_templates.get_template('glm', functools.partial(_glm_background, region, zoom),
+                                              (10, 8), 300, extent=extent + [zoom],
+                                              projection=ccrs.PlateCarree())
+    figure_templates.clear_data(plantilla)
+    ax = plantilla.ax
+    if modo == 'densidad':
+        # Una sola capa raster en lugar de un marcador por celda con flashes
+        pesos = {'duracion': flash_energy_values, 'flash': flash_counts}.get(PESO_DENSIDAD)
+        bordes_lat, bordes_lon, grilla = glm_reader.density_grid(flash_lats, flash_lons, region,
+                                                                  RESOLUCION_DENSIDAD, pesos)
+        sc = ax.pcolormesh(bordes_lon, bordes_lat, np.ma.masked_equal(grilla, 0), cmap='turbo',
+                           shading='flat', transform=ccrs.PlateCarree())
+        etiqueta = {'duracion': 'Duración acumulada (segundos)',
+                    'flash': 'Flashes por celda'}.get(PESO_DENSIDAD, 'Celdas con flashes')
+        marcador = 's'
     else:
-        print("No se encontraron archivos para descargar.")
-except Exception as e:
-    print(f"An error occurred: {e}")
+        sc = ax.scatter(flash_lons, flash_lats, c=flash_energy_values, marker='*', s=30, cmap='turbo', transform=ccrs.PlateCarree())
+        etiqueta = 'Duración (segundos)'
+        marcador = '*'
+    figure_templates.add_data(plantilla, sc)
+    ax.set_extent(extent, crs=ccrs.PlateCarree())
+    barra = plantilla.extras['barra']
+    barra.update_normal(sc)
+    barra.set_label(etiqueta)
+    ax.set_title(f'GLM - Acumulación de 5 minutos - {fecha}', fontweight='bold', fontsize=13)
+    ax.legend(handles=[
+        mlines.Line2D([], [], color='black', marker=marcador, linestyle='None', markersize=6, label='Flashes'),
+        mlines.Line2D([], [], color='none', marker='None', linestyle='None', label=f'Hora Perú: {hora_peru}'),
+        mlines.Line2D([], [], color='none', marker='None', linestyle='None', label=f'Hora GMT: {hora}')
+    ], loc='lower left')
+    output_pipeline.save_figure(plantilla.fig, ruta, dpi=300, bbox_inches='tight', pad_inches=0.1)
+    render_cache.record(ruta, clave)
+    return ruta
+
+_pool = None
+
+def _render_pool():
+    """
+    Pool de procesos para renderizar regiones. Se crea una sola vez por proceso: cada worker
+    'spawn' arranca en frío (importa matplotlib, cartopy y este módulo, ~0.5 s, y vuelve a
+    armar el mapa base), así que solo conviene si se reutiliza.
+    """
+    global _pool
+    if _pool is None:
+        # 'spawn' y no 'fork': si este código corre en un hilo de un proceso con varios
+        # hilos, hacer fork ahí puede dejar al hijo bloqueado en un lock heredado
+        _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1,
+                                    mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+def render_regions(regiones, flashes, fecha, hora, hora_peru, modo=MODO_GRAFICO):
+    """Recorta los flashes para cada región y renderiza los mapas, en paralelo si hay más de uno."""
+    tareas = []
+    for region in regiones:
+        dentro = glm_reader.clip_points(flashes, region)
+        tareas.append((region, dentro.lats, dentro.lons, dentro.duracion,
+                       fecha, hora, hora_peru, output_path(region), dentro.flash, modo))
+
+    if len(tareas) == 1 or not RENDER_EN_PROCESOS:
+        with render_cache.PYPLOT_LOCK:
+            return [plot_region(*tarea) for tarea in tareas]
+    # Los workers dibujan en sus propios procesos: aquí no se toca pyplot ni se toma el lock,
+    # así los gráficos de Dst y Kp no esperan a que terminen
+    futuros = [_render_pool().submit(plot_region, *tarea) for tarea in tareas]
+    return [futuro.result() for futuro in futuros]
+
+@metrics.job('glm')
+def main(regiones=None, modo=MODO_GRAFICO):
+    """
+    Descarga y decodifica el último archivo una sola vez y genera un mapa por región.
+    Retorna True si todo salió bien (o no había nada nuevo).
+    """
+    regiones = [glm_reader.REGIONES[nombre] for nombre in (regiones or REGIONES_SALIDA)]
+    url = None
+    try:
+        now = datetime.utcnow()
+        url = f"{base_url}{now.year}/{now.month:02}/"
+        with metrics.stage('fetch'):
+            last_file_url, modified = get_last_file_url(url)
+        if modified is None:
+            print("No se pudo obtener el listado de archivos.")
+            return False
+
+        if last_file_url and not modified and all(os.path.exists(output_path(r)) for r in regiones):
+            # Camino rápido: no hay archivos nuevos desde la última ejecución
+            print("No hay archivos nuevos; no se regenera el gráfico.")
+            return True
+        if last_file_url:
+            with metrics.stage('fetch'):
+                ruta_nc = download_file(last_file_url)
+            if ruta_nc is None:
+                print("No se pudo descargar el archivo.")
+                http_cache.invalidate(url)
+                return False
+
+            file_name = last_file_url.split('/')[-1]
+            fecha = file_name[10:22]
+            fecha_datetime = datetime.strptime(fecha, '%Y%m%d%H%M')
+            fecha_datetime_peru = fecha_datetime - timedelta(hours=5)
+            fecha = str(fecha_datetime.date())
+            hora = str(fecha_datetime.time().strftime('%H:%M'))
+            hora_peru = str(fecha_datetime_peru.time().strftime('%H:%M'))
+
+            # Abrir el archivo NetCDF desde disco y hacer una sola lectura parcial que cubre
+            # todas las regiones pedidas; el archivo descargado se borra pase lo que pase
+            envolvente = glm_reader.bounding_region(regiones)
+            try:
+                with glm_reader.NETCDF_LOCK:
+                    with metrics.stage('parse'):
+                        dataset = nc.Dataset(ruta_nc)
+                    with metrics.stage('subset'), dataset:
+                        flashes = glm_reader.read_region(dataset, envolvente, variable=DATOS)
+            finally:
+                os.remove(ruta_nc)
+            metrics.increment('flashes', int(flashes.lats.size))
+            metrics.increment('valores_nan', int(np.isnan(flashes.duracion).sum()))
+
+            # El archivo ya decodificado se agrega también a la tabla de glm_backfill (que guarda
+            # flashes), así la animación no vuelve a descargarlo
+            if DATOS == 'flash':
+                try:
+                    for region in regiones:
+                        glm_backfill.append_events(region, file_name, glm_backfill.points_to_events(
+                            fecha_datetime, glm_reader.clip_points(flashes, region)))
+                except OSError as e:
+                    print(f"No se pudo actualizar la tabla de flashes: {e}")
+
+            with metrics.stage('render'):
+                rutas = render_regions(regiones, flashes, fecha, hora, hora_peru, modo)
+            for ruta in rutas:
+                print(f"Mapa listo: {ruta}")
+            return True
+        else:
+            print("No se encontraron archivos para descargar.")
+            return False
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        if url:
+            http_cache.invalidate(url)
+        return False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Mapa de flashes GLM (CPTEC/INPE)')
+    parser.add_argument('--regiones', default=','.join(REGIONES_SALIDA),
+                        help=f"Regiones separadas por comas ({', '.join(glm_reader.REGIONES)})")
+    parser.add_argument('--modo', default=MODO_GRAFICO, choices=['auto', 'puntos', 'densidad'])
+    args = parser.parse_args()
+    main([nombre.strip() for nombre in args.regiones.split(',') if nombre.strip()], args.modo)
@@ -0,0 +1,56 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+#=============================================================================
+# Tiempo de arranque del trabajo Kp
+#
+# Compara, en procesos nuevos, el import del script (camino rápido: descarga,
+# validación y detección de cambios) contra el import del script más
+# matplotlib y Pillow (figure_templates y output_pipeline, que se cargan solo
+# al graficar), que es lo que antes se pagaba en cada ejecución aunque no
+# hubiera nada que graficar.
+# Imprime JSON.
+#=============================================================================
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASOS = {
+    'kp_rapido': "import Kp_PLOT_SWP_GRUPO_2",
+    'kp_con_matplotlib': "import Kp_PLOT_SWP_GRUPO_2; import figure_templates; import output_pipeline",
+    'solo_pyplot': "import matplotlib; matplotlib.use('Agg'); import matplotlib.pyplot",
+}
+
+
+def medir(codigo, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        subprocess.run([sys.executable, '-c', codigo], cwd=RAIZ, check=True)
+        tiempos.append(time.perf_counter() - inicio)
+    return {'mediana_s': round(statistics.median(tiempos), 4),
+            'min_s': round(min(tiempos), 4),
+            'max_s': round(max(tiempos), 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tiempo de arranque del script Kp')
+    parser.add_argument('--repeticiones', type=int, default=10)
+    args = parser.parse_args()
+
+    # Una ejecución previa para que la caché de bytecode y del sistema de archivos esté caliente
+    for codigo in CASOS.values():
+        subprocess.run([sys.executable, '-c', codigo], cwd=RAIZ, check=True)
+
+    resultados = {nombre: medir(codigo, args.repeticiones) for nombre, codigo in CASOS.items()}
+    resultados['ahorro_s'] = round(resultados['kp_con_matplotlib']['mediana_s']
+                                   - resultados['kp_rapido']['mediana_s'], 4)
+    print(json.dumps(resultados, indent=1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+import argparse
+import contextlib
+import http.server
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+#=============================================================================
+# Tiempos por etapa de descarga -> decodificación -> gráfico
+#
+# Se reproducen sin red los datos de los tres trabajos: el dst2502.for.request
+# del repositorio, una respuesta JSON del GFZ (benchmarks/fixtures) y un
+# NetCDF GLM sintético con la grilla de INPE. Las descargas van a un servidor
+# HTTP local. Cada caso reporta tiempo de pared (mediana, mínimo) y memoria
+# pico de Python (tracemalloc; no incluye la memoria interna de HDF5) en JSON.
+#=============================================================================
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(RAIZ, 'benchmarks', 'fixtures')
+ARCHIVO_DST = os.path.join(RAIZ, 'dst2502.for.request')
+ARCHIVO_GFZ = os.path.join(FIXTURES, 'gfz_kp_202502.json')
+
+# Grilla de los archivos GLM acumulados de INPE (grados)
+GLM_LAT = (81.0, -81.0)
+GLM_LON = (-156.0, 6.0)
+GLM_PASO = 0.1
+GLM_CELDAS_CON_FLASH = 20000
+
+
+def dst_legacy(texto):
+    """Decodificación original de update_data(): regex por línea y lista de listas."""
+    data = texto.splitlines()
+    if 'Created at' in data[-1]:
+        data = data[:-1]
+    number_pattern = re.compile(r'-?\d+')
+    values = []
+    for line in data:
+        parts = number_pattern.findall(line)
+        if parts:
+            cleaned_values = []
+            for value in parts[1:]:
+                val = int(value)
+                if val == 9999999999 or abs(val) > 999:
+                    cleaned_values.append(np.nan)
+                else:
+                    cleaned_values.append(val)
+            values.append(cleaned_values[3:-1] if len(cleaned_values) > 3 else [])
+    max_length = max(len(lst) for lst in values) if values else 0
+    for lst in values:
+        while len(lst) < max_length:
+            lst.append(np.nan)
+    return np.array(values, dtype=float)
+
+
+def glm_legacy(dataset, region):
+    """Recorte original del script GLM: lectura completa con [:] e índices 'fancy'."""
+    lat = dataset.variables['lat'][:]
+    lon = dataset.variables['lon'][:]
+    flash_data = dataset.variables['flash'][:]
+    lat_inds = np.where((lat >= region.lat_min) & (lat <= region.lat_max))[0]
+    lon_inds = np.where((lon >= region.lon_min) & (lon <= region.lon_max))[0]
+    flash_data_peru = flash_data[:, lat_inds, :][:, :, lon_inds]
+    flash_indices = np.where(flash_data_peru > 0)
+    flash_energy = dataset.variables['duration_flash'][:]
+    flash_energy_peru = flash_energy[:, lat_inds, :][:, :, lon_inds]
+    return (lat[lat_inds][flash_indices[1]], lon[lon_inds][flash_indices[2]],
+            flash_energy_peru[flash_indices])
+
+
+def write_synthetic_glm(ruta, semilla=0):
+    """NetCDF con la estructura de los GLM_acum5 de INPE y flashes dispersos al azar."""
+    import netCDF4 as nc
+
+    lat = np.round(np.arange(GLM_LAT[0], GLM_LAT[1] - GLM_PASO / 2, -GLM_PASO), 2)
+    lon = np.round(np.arange(GLM_LON[0], GLM_LON[1] + GLM_PASO / 2, GLM_PASO), 2)
+    rng = np.random.default_rng(semilla)
+    flash = np.zeros((1, lat.size, lon.size), dtype=np.float32)
+    duracion = np.zeros_like(flash)
+    i = rng.integers(0, lat.size, GLM_CELDAS_CON_FLASH)
+    j = rng.integers(0, lon.size, GLM_CELDAS_CON_FLASH)
+    flash[0, i, j] = rng.integers(1, 20, GLM_CELDAS_CON_FLASH)
+    duracion[0, i, j] = rng.gamma(2.0, 0.2, GLM_CELDAS_CON_FLASH)
+
+    with nc.Dataset(ruta, 'w') as dataset:
+        dataset.createDimension('time', 1)
+        dataset.createDimension('lat', lat.size)
+        dataset.createDimension('lon', lon.size)
+        dataset.createVariable('lat', 'f4', ('lat',))[:] = lat
+        dataset.createVariable('lon', 'f4', ('lon',))[:] = lon
+        for nombre, datos in (('flash', flash), ('duration_flash', duracion)):
+            dataset.createVariable(nombre, 'f4', ('time', 'lat', 'lon'), zlib=True, complevel=4)[:] = datos
+
+
+class _Servidor(http.server.BaseHTTPRequestHandler):
+    archivos = {}
+
+    def do_GET(self):
+        cuerpo = self.archivos.get(self.path)
+        if cuerpo is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(archivos):
+    """Servidor HTTP local que sirve {ruta: bytes}; retorna (servidor, url base)."""
+    _Servidor.archivos = archivos
+    servidor = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Servidor)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f'http://127.0.0.1:{servidor.server_address[1]}'
+
+
+def medir(funcion, repeticiones, preparar=None):
+    """Tiempo de pared de 'funcion' y memoria pico (una ejecución aparte con tracemalloc)."""
+    tiempos = []
+    for _ in range(repeticiones):
+        if preparar:
+            preparar()
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+
+    if preparar:
+        preparar()
+    tracemalloc.start()
+    funcion()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'mediana_s': round(statistics.median(tiempos), 5), 'min_s': round(min(tiempos), 5),
+            'pico_mb': round(pico / 2 ** 20, 3)}
+
+
+def _caso(resultados, etapa, nombre, funcion, repeticiones, preparar=None):
+    try:
+        # Los mensajes de los scripts van a stderr para que stdout quede solo con el JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            resultados.setdefault(etapa, {})[nombre] = medir(funcion, repeticiones, preparar)
+    except Exception as e:
+        resultados.setdefault(etapa, {})[nombre] = {'error': f'{type(e).__name__}: {e}'}
+    print(f"{etapa}/{nombre}: {resultados[etapa][nombre]}", file=sys.stderr)
+
+
+def run(repeticiones, etapas, directorio):
+    # Caches y gráficos del benchmark en un directorio temporal, nunca en ~/.cache/swp
+    os.environ['SWP_DATA_DIR'] = os.path.join(directorio, 'datos')
+    sys.path.insert(0, RAIZ)
+    import matplotlib
+    matplotlib.use('Agg')
+    import netCDF4 as nc
+
+    import dst_parser
+    import dst_store
+    import glm_reader
+    import gfz_client
+    import http_cache
+    import retry
+
+    with open(ARCHIVO_DST, 'rb') as archivo:
+        contenido_dst = archivo.read()
+    with open(ARCHIVO_GFZ, 'rb') as archivo:
+        contenido_gfz = archivo.read()
+    ruta_glm = os.path.join(directorio, 'GLM_acum5_202502101200.nc')
+    write_synthetic_glm(ruta_glm)
+    with open(ruta_glm, 'rb') as archivo:
+        contenido_glm = archivo.read()
+    region = glm_reader.REGIONES['peru']
+
+    resultados = {'repeticiones': repeticiones,
+                  'bytes': {'dst': len(contenido_dst), 'gfz': len(contenido_gfz), 'glm': len(contenido_glm)}}
+
+    if 'descarga' in etapas:
+        servidor, base = start_server({'/dst.for.request': contenido_dst, '/gfz.json': contenido_gfz,
+                                       '/glm.nc': contenido_glm})
+        for nombre, ruta in (('dst', '/dst.for.request'), ('gfz', '/gfz.json'), ('glm', '/glm.nc')):
+            _caso(resultados, 'descarga', nombre,
+                  lambda: http_cache.fetch(base + ruta, cache=False), repeticiones)
+        # Descarga por bloques a disco (retry.download_file): la memoria no depende del tamaño
+        ruta_disco = os.path.join(directorio, 'descarga.nc')
+        _caso(resultados, 'descarga', 'glm_a_disco', lambda: retry.download_file(base + '/glm.nc', ruta_disco),
+              repeticiones, lambda: os.path.exists(ruta_disco) and os.remove(ruta_disco))
+        servidor.shutdown()
+
+    if 'parseo' in etapas:
+        texto_dst = contenido_dst.decode('ascii', errors='replace')
+        _caso(resultados, 'parseo', 'dst_regex', lambda: dst_legacy(texto_dst), repeticiones)
+        _caso(resultados, 'parseo', 'dst_parser', lambda: dst_parser.parse_dst_request(contenido_dst), repeticiones)
+        _caso(resultados, 'parseo', 'gfz_json_loads', lambda: json.loads(contenido_gfz), repeticiones)
+        _caso(resultados, 'parseo', 'gfz_client', lambda: gfz_client.parse_response(contenido_gfz, 'Kp'),
+              repeticiones)
+
+        def subset(lector):
+            with nc.Dataset('in-memory.nc', memory=contenido_glm) as dataset:
+                return lector(dataset, region)
+        _caso(resultados, 'parseo', 'glm_completo', lambda: subset(glm_legacy), repeticiones)
+        _caso(resultados, 'parseo', 'glm_reader', lambda: subset(glm_reader.read_region), repeticiones)
+
+    if 'render' in etapas:
+        import DST_PLOT_SWP_GRUPO_2 as dst_job
+        import Kp_PLOT_SWP_GRUPO_2 as kp_job
+
+        fechas, horas, _, versiones = dst_parser.parse_dst_request(contenido_dst)
+        dst_store.upsert_days(fechas, horas, versiones)
+        tiempos_kp, valores_kp = gfz_client.parse_response(contenido_gfz, 'Kp')
+        ruta_dst = os.path.join(directorio, 'dst.png')
+        ruta_kp = os.path.join(directorio, 'kp.png')
+        kp_job.RUTA_GUARDADO = ruta_kp
+
+        # Se borra la salida antes de cada repetición para que la caché de gráficos no la salte
+        def borrar(ruta):
+            return lambda: os.path.exists(ruta) and os.remove(ruta)
+        _caso(resultados, 'render', 'dst_savefig_300dpi',
+              lambda: dst_job.plot_window(fechas[0], fechas[-1] + 1, 'Benchmark', ruta=ruta_dst),
+              repeticiones, borrar(ruta_dst))
+        _caso(resultados, 'render', 'kp_savefig_300dpi',
+              lambda: kp_job.plotKpIndex(tiempos_kp, valores_kp), repeticiones, borrar(ruta_kp))
+
+        # Un savefig directo contra un render con todas las variantes (completa, web, miniatura)
+        import figure_templates
+        import output_pipeline
+        figura_dst = figure_templates.get_template('dst', dst_job._dst_background, (10, 6), 300).fig
+        variantes = list(output_pipeline.VARIANTES.values())
+        rutas_variantes = [output_pipeline.variant_path(ruta_dst, variante) for variante in variantes]
+        _caso(resultados, 'render', 'dst_png_directo',
+              lambda: figura_dst.savefig(ruta_dst, dpi=300, bbox_inches='tight'), repeticiones)
+        _caso(resultados, 'render', 'dst_variantes',
+              lambda: output_pipeline.save_figure(figura_dst, ruta_dst, variantes, dpi=300, bbox_inches='tight'),
+              repeticiones, lambda: [os.remove(ruta) for ruta in rutas_variantes if os.path.exists(ruta)])
+
+        # El mapa GLM necesita las teselas OSM y Natural Earth (caché en disco o red)
+        import PLOT_GLM_INPE_PLOT_SWP_GRUPO_3 as glm_job
+        with nc.Dataset('in-memory.nc', memory=contenido_glm) as dataset:
+            flashes = glm_reader.read_region(dataset, region)
+        ruta_glm_png = os.path.join(directorio, 'glm.png')
+        _caso(resultados, 'render', 'glm_savefig_300dpi',
+              lambda: glm_job.plot_region(region, flashes.lats, flashes.lons, flashes.duracion, '2025-02-10',
+                                          '12:00', '07:00', ruta_glm_png, flashes.flash),
+              repeticiones, borrar(ruta_glm_png))
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tiempos por etapa de los trabajos Dst, Kp y GLM (sin red)')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--etapas', default='descarga,parseo,render',
+                        help='Etapas separadas por comas (descarga, parseo, render)')
+    parser.add_argument('--salida', default=None, help='Archivo JSON de resultados (por defecto: stdout)')
+    args = parser.parse_args()
+    etapas = {etapa.strip() for etapa in args.etapas.split(',') if etapa.strip()}
+
+    with tempfile.TemporaryDirectory() as directorio:
+        resultados = run(args.repeticiones, etapas, directorio)
+
+    texto = json.dumps(resultados, indent=1)
+    if args.salida:
+        with open(args.salida, 'w') as archivo:
+            archivo.write(texto + '\n')
+    else:
+        print(texto)
+
+
+if __name__ == "__main__":
+    main()
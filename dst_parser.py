@@ -0,0 +1,85 @@
+import numpy as np
+
+#========================================================================================
+# Lector del formato de ancho fijo WDC (Kyoto) para archivos dstYYMM.for.request
+#
+#   Columnas   Descripción
+#   1-3        'DST'
+#   4-5        Últimos dos dígitos del año
+#   6-7        Mes
+#   8          '*'
+#   9-10       Día
+#   11-12      Espacios o 'RR' (quicklook)
+#   13         'X'
+#   14         Versión (0: quicklook, 1: provisional, 2: final)
+#   15-16      Primeros dos dígitos del año (espacio para 19XX)
+#   17-20      Valor base (unidad 100 nT)
+#   21-116     24 valores horarios (4 caracteres cada uno, unidad 1 nT)
+#   117-120    Promedio diario (unidad 1 nT)
+#========================================================================================
+
+LONGITUD_REGISTRO = 120
+VALOR_FALTANTE = 9999
+
+_POTENCIAS = np.array([1000, 100, 10, 1], dtype=np.int32)
+
+
+def _campos_enteros(bloque):
+    """Convierte un bloque (n, k, w) de bytes ASCII alineados a la derecha en enteros (n, k)."""
+    digitos = bloque - ord('0')
+    es_digito = (digitos >= 0) & (digitos <= 9)
+    pesos = _POTENCIAS[-bloque.shape[-1]:]
+    valores = np.where(es_digito, digitos, 0).astype(np.int32) @ pesos
+    negativos = (bloque == ord('-')).any(axis=-1)
+    return np.where(negativos, -valores, valores)
+
+
+def parse_dst_request(contenido):
+    """
+    Decodifica el contenido de un archivo dstYYMM.for.request en una sola pasada vectorizada.
+
+    Retorna (fechas, horas, promedios, versiones):
+      fechas     -> np.ndarray datetime64[D] con un elemento por día
+      horas      -> np.ma.MaskedArray int16 (días, 24), 9999 enmascarado
+      promedios  -> np.ma.MaskedArray int16 (días,), 9999 enmascarado
+      versiones  -> np.ndarray int8 (días,)
+    """
+    if isinstance(contenido, str):
+        contenido = contenido.encode('ascii', errors='replace')
+
+    # Solo los registros de datos; se descarta la línea 'Created at' y las líneas vacías
+    lineas = [linea.rstrip(b'\r').ljust(LONGITUD_REGISTRO)[:LONGITUD_REGISTRO]
+              for linea in contenido.split(b'\n') if linea.startswith(b'DST')]
+    if not lineas:
+        vacio = np.ma.masked_array(np.empty((0, 24), dtype=np.int16))
+        return (np.empty(0, dtype='datetime64[D]'), vacio,
+                np.ma.masked_array(np.empty(0, dtype=np.int16)), np.empty(0, dtype=np.int8))
+
+    registros = np.frombuffer(b''.join(lineas), dtype=np.uint8).reshape(len(lineas), LONGITUD_REGISTRO)
+
+    # Fecha: siglo (col. 15-16, espacio = 19), año (4-5), mes (6-7), día (9-10)
+    siglo = _campos_enteros(registros[:, 14:16][:, None, :])[:, 0]
+    siglo = np.where(siglo == 0, 19, siglo)
+    anio = siglo * 100 + _campos_enteros(registros[:, 3:5][:, None, :])[:, 0]
+    mes = _campos_enteros(registros[:, 5:7][:, None, :])[:, 0]
+    dia = _campos_enteros(registros[:, 8:10][:, None, :])[:, 0]
+    fechas = ((anio - 1970) * 12 + mes - 1).astype('datetime64[M]').astype('datetime64[D]') \
+        + (dia - 1).astype('timedelta64[D]')
+
+    versiones = (registros[:, 13].astype(np.int16) - ord('0')).astype(np.int8)
+    base = _campos_enteros(registros[:, 16:20][:, None, :])[:, 0] * 100
+
+    # 24 valores horarios + promedio diario en campos de 4 caracteres
+    campos = _campos_enteros(registros[:, 20:120].reshape(len(lineas), 25, 4))
+    faltantes = campos == VALOR_FALTANTE
+    campos = np.where(faltantes, VALOR_FALTANTE, campos + base[:, None]).astype(np.int16)
+
+    horas = np.ma.masked_array(campos[:, :24], mask=faltantes[:, :24])
+    promedios = np.ma.masked_array(campos[:, 24], mask=faltantes[:, 24])
+    return fechas, horas, promedios, versiones
+
+
+def read_dst_request(ruta):
+    """Lee y decodifica un archivo dstYYMM.for.request desde disco."""
+    with open(ruta, 'rb') as archivo:
+        return parse_dst_request(archivo.read())
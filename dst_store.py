@@ -0,0 +1,134 @@
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+
+from swp_paths import data_dir
+
+#========================================================================================
+# Archivo local de Dst horario
+#
+#   valores.i2   -> int16 crudo, una fila por hora desde EPOCA (memory-mapped)
+#   indice.json  -> índice pequeño por mes: {'YYYY-MM': {versión, horas válidas, ...}}
+#
+# La posición de cada hora es fija (horas desde EPOCA), así que leer cualquier ventana
+# es un slice del memmap y actualizar un mes solo escribe las horas que cambiaron.
+#========================================================================================
+
+EPOCA = np.datetime64('1957-01-01T00', 'h')  # Inicio de la serie Dst
+VALOR_FALTANTE = 9999
+ARCHIVO_VALORES = 'valores.i2'
+ARCHIVO_INDICE = 'indice.json'
+
+
+def _directorio(directorio):
+    return directorio if directorio is not None else data_dir('dst')
+
+
+def _hora(instante):
+    return np.datetime64(instante, 'h')
+
+
+def load_index(directorio=None):
+    """Carga el índice por mes del archivo (diccionario vacío si aún no existe)."""
+    ruta = os.path.join(_directorio(directorio), ARCHIVO_INDICE)
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta, 'r') as archivo:
+        return json.load(archivo)
+
+
+def _guardar_indice(indice, directorio):
+    ruta = os.path.join(directorio, ARCHIVO_INDICE)
+    temporal = ruta + '.tmp'
+    with open(temporal, 'w') as archivo:
+        json.dump(indice, archivo, indent=1, sort_keys=True)
+    os.replace(temporal, ruta)
+
+
+def _asegurar_longitud(ruta, horas):
+    """Extiende el archivo de valores con VALOR_FALTANTE hasta cubrir 'horas' filas."""
+    actuales = os.path.getsize(ruta) // 2 if os.path.exists(ruta) else 0
+    if actuales < horas:
+        with open(ruta, 'ab') as archivo:
+            np.full(horas - actuales, VALOR_FALTANTE, dtype=np.int16).tofile(archivo)
+
+
+def month_complete(anio, mes, directorio=None):
+    """True si el mes ya está en el archivo con todas sus horas disponibles."""
+    info = load_index(directorio).get(f'{anio:04d}-{mes:02d}')
+    return bool(info) and info['validas'] == info['horas']
+
+
+def upsert_days(fechas, horas, versiones=None, directorio=None):
+    """
+    Inserta o revisa los días decodificados por dst_parser en el archivo.
+
+    Solo se escriben las horas cuyo valor difiere del almacenado. Retorna el número
+    de horas que cambiaron (0 si el archivo ya estaba al día).
+    """
+    directorio = _directorio(directorio)
+    if len(fechas) == 0:
+        return 0
+
+    ruta = os.path.join(directorio, ARCHIVO_VALORES)
+    nuevos = np.ma.filled(horas, VALOR_FALTANTE).astype(np.int16).ravel()
+    inicio = int((fechas[0].astype('datetime64[h]') - EPOCA).astype(int))
+    fin = inicio + nuevos.size
+    if inicio < 0:
+        raise ValueError(f"Fecha anterior al inicio del archivo: {fechas[0]}")
+    # Los días deben ser consecutivos para escribirse como un solo bloque
+    if fin != int((fechas[-1].astype('datetime64[h]') - EPOCA).astype(int)) + 24:
+        raise ValueError("Los días a insertar no son consecutivos")
+
+    _asegurar_longitud(ruta, fin)
+    valores = np.memmap(ruta, dtype=np.int16, mode='r+')
+    cambios = np.flatnonzero(valores[inicio:fin] != nuevos)
+    if cambios.size:
+        valores[inicio + cambios] = nuevos[cambios]
+        valores.flush()
+    del valores
+
+    # Actualizar el índice de los meses afectados
+    indice = load_index(directorio)
+    meses = fechas.astype('datetime64[M]')
+    for mes in np.unique(meses):
+        en_mes = meses == mes
+        clave = str(mes)
+        horas_mes = int(((mes + 1).astype('datetime64[h]') - mes.astype('datetime64[h]')).astype(int))
+        info = indice.get(clave, {})
+        info['horas'] = horas_mes
+        info['validas'] = int((np.ma.filled(horas, VALOR_FALTANTE)[en_mes] != VALOR_FALTANTE).sum())
+        if versiones is not None and np.any(en_mes):
+            info['version'] = int(np.min(versiones[en_mes]))
+        if cambios.size or 'actualizado' not in info:
+            info['actualizado'] = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        indice[clave] = info
+    _guardar_indice(indice, directorio)
+    return int(cambios.size)
+
+
+def read_window(inicio, fin, directorio=None):
+    """
+    Lee las horas en [inicio, fin) directamente del archivo.
+
+    Retorna (tiempos datetime64[h], valores np.ma.MaskedArray int16). Las horas que no
+    están en el archivo se devuelven enmascaradas.
+    """
+    directorio = _directorio(directorio)
+    inicio, fin = _hora(inicio), _hora(fin)
+    tiempos = np.arange(inicio, fin, dtype='datetime64[h]')
+    valores = np.full(tiempos.size, VALOR_FALTANTE, dtype=np.int16)
+
+    ruta = os.path.join(directorio, ARCHIVO_VALORES)
+    if tiempos.size and os.path.exists(ruta) and os.path.getsize(ruta):
+        archivo = np.memmap(ruta, dtype=np.int16, mode='r')
+        desde = int((inicio - EPOCA).astype(int))
+        a = max(desde, 0)
+        b = min(desde + tiempos.size, archivo.size)
+        if a < b:
+            valores[a - desde:b - desde] = archivo[a:b]
+        del archivo
+
+    return tiempos, np.ma.masked_equal(valores, VALOR_FALTANTE, copy=False)
@@ -0,0 +1,107 @@
+import os
+from collections import namedtuple
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from swp_paths import data_dir
+
+#=============================================================================
+# Plantillas de figuras reutilizables
+#
+# La parte estática de cada gráfico (bandas de intensidad, leyendas, ejes,
+# mapa base) se construye una sola vez por (tipo, extensión, tamaño, dpi) y
+# la figura queda en memoria. En cada actualización solo se quitan los
+# artistas de datos anteriores (curva Dst, barras Kp, flashes) y se agregan
+# los nuevos antes de guardar. Las figuras se crean sin pyplot, así que no se
+# acumulan en su registro global en un proceso residente.
+#
+# Para los mapas GLM, las teselas OSM, costas y fronteras se dibujan una vez
+# con cartopy y se guardan como PNG (basemap_raster); como la proyección es
+# PlateCarree, la imagen se coloca con imshow(extent=...).
+#=============================================================================
+
+Plantilla = namedtuple('Plantilla', ['fig', 'ax', 'extras', 'artistas'])
+
+_PLANTILLAS = {}
+
+
+def get_template(tipo, construir, figsize, dpi, extent=None, projection=None):
+    """
+    Plantilla en caché para (tipo, extent, figsize, dpi); se construye la primera vez.
+
+    'construir(fig, ax)' dibuja la parte estática y puede retornar un diccionario con
+    objetos que las actualizaciones necesitan (p. ej. la barra de colores), en 'extras'.
+    """
+    clave = (tipo, tuple(extent) if extent is not None else None, tuple(figsize), dpi)
+    plantilla = _PLANTILLAS.get(clave)
+    if plantilla is None:
+        fig = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(1, 1, 1, projection=projection)
+        extras = construir(fig, ax) or {}
+        plantilla = Plantilla(fig, ax, extras, [])
+        _PLANTILLAS[clave] = plantilla
+    return plantilla
+
+
+def add_data(plantilla, *artistas):
+    """Registra artistas de datos para quitarlos en la siguiente actualización."""
+    plantilla.artistas.extend(artistas)
+
+
+def clear_data(plantilla):
+    """Quita los artistas de datos de la actualización anterior."""
+    for artista in plantilla.artistas:
+        artista.remove()
+    plantilla.artistas.clear()
+
+
+def save(plantilla, ruta, **kwargs):
+    """Guarda la figura de la plantilla (mismos argumentos que savefig)."""
+    plantilla.fig.savefig(ruta, **kwargs)
+
+
+def clear_cache():
+    """Olvida todas las plantillas (p. ej. después de cambiar estilos)."""
+    _PLANTILLAS.clear()
+
+
+def basemap_raster(region, zoom, ancho, dpi=100, directorio=None):
+    """
+    Ruta del PNG con el mapa base (OSM, costas, fronteras) de la región; se dibuja solo si no existe.
+
+    El eje ocupa toda la imagen y el alto sale de la proporción lon/lat, así que la imagen
+    cubre exactamente [lon_min, lon_max] x [lat_min, lat_max] en PlateCarree.
+    """
+    alto = int(round(ancho * (region.lat_max - region.lat_min) / (region.lon_max - region.lon_min)))
+    directorio = directorio if directorio is not None else data_dir('mapas_base')
+    ruta = os.path.join(directorio, f'{region.nombre}_z{zoom}_{ancho}x{alto}.png')
+    if os.path.exists(ruta):
+        return ruta
+
+    # cartopy solo hace falta la primera vez
+    import cartopy.crs as ccrs
+    import cartopy.feature as cfeature
+    import glm_maps
+
+    print(f"Dibujando el mapa base de {region.nombre} ({ancho}x{alto})...")
+    fig = Figure(figsize=(ancho / dpi, alto / dpi), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_axes([0, 0, 1, 1], projection=ccrs.PlateCarree())
+    ax.set_extent([region.lon_min, region.lon_max, region.lat_min, region.lat_max], crs=ccrs.PlateCarree())
+    ax.add_image(glm_maps.osm_tiles(), zoom)
+    ax.add_feature(cfeature.COASTLINE)
+    ax.add_feature(cfeature.BORDERS, linestyle=':')
+    ax.set_axis_off()
+    temporal = ruta + '.tmp.png'
+    fig.savefig(temporal, dpi=dpi)
+    os.replace(temporal, ruta)
+    return ruta
+
+
+def load_raster(ruta):
+    """Arreglo RGB(A) de un PNG (para imshow)."""
+    from PIL import Image
+    return np.asarray(Image.open(ruta))
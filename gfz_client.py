@@ -0,0 +1,180 @@
+import contextvars
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import requests
+
+import http_cache
+import retry
+from swp_paths import data_dir
+
+#=============================================================================
+# Cliente de varios índices del GFZ (Kp, ap, Ap, Hp30, SN, F10.7, ...)
+#
+# Cada índice se guarda en una caché local (serie de tiempo en .npz) junto con
+# la lista de intervalos ya consultados. En cada llamada solo se piden los
+# huecos de la ventana que ningún intervalo cubre (p. ej. días sin ejecuciones
+# entre dos consultas) y la cola reciente, con un margen para las revisiones de
+# los valores "nowcast". Las consultas de todos los índices corren en paralelo
+# sobre la sesión HTTP compartida.
+#=============================================================================
+
+API_URL = 'https://kp.gfz-potsdam.de/app/json/'
+VALID_INDICES = ['Kp', 'ap', 'Ap', 'Cp', 'C9', 'Hp30', 'Hp60', 'ap30', 'ap60', 'SN', 'Fobs', 'Fadj']
+SIN_STATUS = ['Hp30', 'Hp60', 'ap30', 'ap60', 'Fobs', 'Fadj']  # Índices que no aceptan 'status'
+MARGEN_REVISION = timedelta(days=1)  # La cola se vuelve a pedir para recoger revisiones
+
+
+def _segundo(instante):
+    if isinstance(instante, datetime) and instante.tzinfo is not None:
+        instante = instante.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(instante, 's')
+
+
+def index_url(index, inicio, fin, status='all'):
+    """URL de la API JSON del GFZ para un índice y un intervalo (instantes datetime64)."""
+    url = (f"{API_URL}?start={np.datetime_as_string(inicio, unit='s')}Z"
+           f"&end={np.datetime_as_string(fin, unit='s')}Z&index={index}")
+    if status == 'def' and index not in SIN_STATUS:
+        url += '&status=def'
+    return url
+
+
+def parse_response(content, index):
+    """Decodifica la respuesta JSON en (tiempos datetime64[s], valores float64)."""
+    data = json.loads(content)
+    tiempos = np.array([t.rstrip('Z') for t in data['datetime']], dtype='datetime64[s]')
+    valores = np.array([np.nan if v is None else v for v in data[index]], dtype=np.float64)
+    return tiempos, valores
+
+
+def _ruta(index, status, directorio):
+    directorio = directorio if directorio is not None else data_dir('gfz')
+    return os.path.join(directorio, f'{index}_{status}.npz')
+
+
+def load_cache(index, status='all', directorio=None):
+    """
+    Serie guardada de un índice: (tiempos, valores, cubiertos) o None.
+
+    'cubiertos' es un arreglo (n, 2) datetime64[s] de intervalos [a, b] ya consultados,
+    ordenados y sin solaparse.
+    """
+    ruta = _ruta(index, status, directorio)
+    if not os.path.exists(ruta):
+        return None
+    with np.load(ruta) as datos:
+        return datos['t'], datos['v'], datos['cubierto']
+
+
+def _guardar(index, status, directorio, tiempos, valores, cubiertos):
+    ruta = _ruta(index, status, directorio)
+    temporal = ruta + '.tmp'
+    with open(temporal, 'wb') as archivo:
+        np.savez(archivo, t=tiempos, v=valores, cubierto=np.asarray(cubiertos, dtype='datetime64[s]'))
+    os.replace(temporal, ruta)
+
+
+def _unir_intervalos(intervalos):
+    """Ordena los intervalos [a, b] y une los que se solapan o se tocan."""
+    unidos = []
+    for a, b in sorted((a, b) for a, b in intervalos):
+        if unidos and a <= unidos[-1][1]:
+            unidos[-1][1] = max(unidos[-1][1], b)
+        else:
+            unidos.append([a, b])
+    return [tuple(intervalo) for intervalo in unidos]
+
+
+def _tramos_faltantes(cache, inicio, fin, margen):
+    """Intervalos [a, b] que hay que pedir a la API para cubrir [inicio, fin]."""
+    if cache is None or len(cache[2]) == 0:
+        return [(inicio, fin)]
+    cubiertos = [tuple(intervalo) for intervalo in cache[2]]
+    # El final de lo cubierto se vuelve a pedir para recoger las revisiones recientes
+    a, b = cubiertos[-1]
+    cubiertos[-1] = (a, max(a, b - np.timedelta64(margen)))
+
+    tramos = []
+    cursor = inicio
+    for a, b in cubiertos:
+        if cursor >= fin:
+            break
+        if b < cursor:
+            continue
+        if a > cursor:
+            tramos.append((cursor, min(a, fin)))
+        cursor = max(cursor, b)
+    if cursor < fin:
+        tramos.append((cursor, fin))
+    return tramos
+
+
+def _mezclar(tiempos_viejos, valores_viejos, tiempos_nuevos, valores_nuevos):
+    """Une dos series ordenadas; en tiempos repetidos prevalece el valor nuevo."""
+    tiempos = np.concatenate([tiempos_nuevos, tiempos_viejos])
+    valores = np.concatenate([valores_nuevos, valores_viejos])
+    tiempos, primeros = np.unique(tiempos, return_index=True)
+    return tiempos, valores[primeros]
+
+
+def _pedir(index, a, b, status):
+    url = index_url(index, a, b, status)
+    response = retry.call(http_cache.fetch, url, timeout=10, cache=False, url=url)
+    return parse_response(response.content, index)
+
+
+def fetch_indices(indices, inicio, fin, status='all', hilos=None, directorio=None, margen=MARGEN_REVISION):
+    """
+    Retorna {índice: (tiempos datetime64[s], valores float64)} para [inicio, fin].
+
+    Solo se consultan a la API los tramos que la caché local no cubre. Si una consulta
+    falla, se devuelve lo que haya en caché para ese índice.
+    """
+    inicio, fin = _segundo(inicio), _segundo(fin)
+    if inicio > fin:
+        raise ValueError("Error! Start time must be before or equal to end time")
+    for index in indices:
+        if index not in VALID_INDICES:
+            raise ValueError(f"Error! Wrong index parameter! \nAllowed are only the following: {', '.join(VALID_INDICES)}")
+
+    caches = {index: load_cache(index, status, directorio) for index in indices}
+    tareas = [(index, a, b) for index in indices for a, b in _tramos_faltantes(caches[index], inicio, fin, margen)]
+
+    resultados = {}
+    if tareas:
+        with ThreadPoolExecutor(max_workers=hilos or len(tareas)) as pool:
+            # Cada hilo corre en una copia del contexto para que sus métricas cuenten en el trabajo
+            futuros = [(tarea, pool.submit(contextvars.copy_context().run, _pedir, *tarea, status))
+                       for tarea in tareas]
+            for (index, a, b), futuro in futuros:
+                try:
+                    resultados.setdefault(index, []).append((a, b, futuro.result()))
+                except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                    print(f"Error obteniendo {index} entre {a} y {b}: {e}")
+
+    series = {}
+    for index in indices:
+        cache = caches[index]
+        if cache is None:
+            tiempos = np.empty(0, dtype='datetime64[s]')
+            valores = np.empty(0, dtype=np.float64)
+            cubiertos = []
+        else:
+            tiempos, valores, cubiertos = cache
+            cubiertos = [tuple(intervalo) for intervalo in cubiertos]
+
+        # Solo los tramos que se pudieron consultar cuentan como cubiertos
+        for a, b, (t_nuevos, v_nuevos) in resultados.get(index, []):
+            tiempos, valores = _mezclar(tiempos, valores, t_nuevos, v_nuevos)
+            cubiertos.append((a, b))
+        if resultados.get(index):
+            _guardar(index, status, directorio, tiempos, valores, _unir_intervalos(cubiertos))
+
+        desde = np.searchsorted(tiempos, inicio, side='left')
+        hasta = np.searchsorted(tiempos, fin, side='right')
+        series[index] = (tiempos[desde:hasta], valores[desde:hasta])
+    return series
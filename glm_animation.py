@@ -0,0 +1,209 @@
+import argparse
+import functools
+import os
+import shutil
+import subprocess
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from PIL import Image
+
+import figure_templates
+import glm_backfill
+import glm_maps
+import glm_reader
+import metrics
+import render_cache
+from swp_paths import data_dir
+
+#=============================================================================
+# Animación GLM de las últimas N horas (GIF y, si hay ffmpeg, MP4)
+#
+# - El mapa base (teselas OSM, costas y fronteras) se dibuja con cartopy una
+#   sola vez por región y tamaño y se guarda como PNG (figure_templates). Como
+#   la proyección es PlateCarree, la plantilla de los cuadros lo pone con
+#   imshow(extent=...) y cada cuadro solo agrega los flashes en grados.
+# - Los flashes salen de la tabla de glm_backfill (un cuadro por archivo de
+#   5 minutos). Cada cuadro se guarda en una caché rotativa: en cada ciclo
+#   solo se dibujan los cuadros nuevos o cuyos datos cambiaron.
+#=============================================================================
+
+HORAS_ANIMACION = 3
+ANCHO_PX = 800  # Ancho de los cuadros; el alto sale de la proporción de la región
+DPI_ANIMACION = 100
+MS_POR_CUADRO = 200
+VMAX_DURACION = 2.0  # Escala fija de color (segundos) para que los cuadros sean comparables
+RUTA_GUARDADO = "./"
+
+
+def _directorio(region, directorio):
+    return directorio if directorio is not None else data_dir('glm', 'animacion', region.nombre)
+
+
+def frame_size(region, ancho=ANCHO_PX):
+    """(ancho, alto) en píxeles con la misma proporción lon/lat que la región."""
+    alto = ancho * (region.lat_max - region.lat_min) / (region.lon_max - region.lon_min)
+    return ancho, int(round(alto))
+
+
+def _frame_background(region, fondo, fig, ax):
+    """Parte fija de los cuadros: mapa base, fuente y barra de colores (escala fija)."""
+    from matplotlib.cm import ScalarMappable
+    from matplotlib.colors import Normalize
+
+    ax.set_position([0, 0, 1, 1])
+    extent = (region.lon_min, region.lon_max, region.lat_min, region.lat_max)
+    ax.imshow(figure_templates.load_raster(fondo), extent=extent, origin='upper', interpolation='nearest')
+    ax.set_xlim(extent[0], extent[1])
+    ax.set_ylim(extent[2], extent[3])
+    ax.set_axis_off()
+    ax.text(0.98, 0.01, 'Fuente: CPTEC/INPE', transform=ax.transAxes, ha='right', va='bottom', fontsize=7)
+    barra = fig.add_axes([0.55, 0.06, 0.4, 0.02])
+    fig.colorbar(ScalarMappable(norm=Normalize(0, VMAX_DURACION), cmap='turbo'), cax=barra,
+                 orientation='horizontal', label='Duración (segundos)')
+    barra.xaxis.label.set_size(8)
+    barra.tick_params(labelsize=7)
+
+
+def render_frame(instante, eventos, region, fondo, ruta, ancho=ANCHO_PX):
+    """Dibuja un cuadro: sobre la plantilla (mapa base) solo los flashes del archivo 'instante'."""
+    ancho, alto = frame_size(region, ancho)
+    plantilla = figure_templates.get_template(
+        'glm_cuadro', functools.partial(_frame_background, region, fondo),
+        (ancho / DPI_ANIMACION, alto / DPI_ANIMACION), DPI_ANIMACION, extent=(region[1:], fondo))
+    figure_templates.clear_data(plantilla)
+    ax = plantilla.ax
+    sc = ax.scatter(eventos['lon'], eventos['lat'], c=eventos['duracion'], marker='*', s=30,
+                    cmap='turbo', vmin=0, vmax=VMAX_DURACION)
+    hora_peru = instante - timedelta(hours=5)
+    texto = ax.text(0.02, 0.98, f'GLM - {instante:%Y-%m-%d}\nHora GMT: {instante:%H:%M}\nHora Perú: {hora_peru:%H:%M}',
+                    transform=ax.transAxes, ha='left', va='top', fontsize=9,
+                    bbox={'facecolor': 'white', 'alpha': 0.8, 'edgecolor': 'none'})
+    figure_templates.add_data(plantilla, sc, texto)
+
+    temporal = ruta + '.tmp.png'
+    figure_templates.save(plantilla, temporal, dpi=DPI_ANIMACION)
+    os.replace(temporal, ruta)
+
+
+def update_frames(region, inicio, fin, ancho=ANCHO_PX, directorio=None):
+    """
+    Actualiza la caché de cuadros de [inicio, fin) y borra los que quedaron fuera.
+
+    Hay un cuadro por archivo incorporado por glm_backfill (aunque no tenga flashes).
+    Retorna (rutas de los cuadros en orden, número de cuadros dibujados en esta llamada).
+    """
+    carpeta = _directorio(region, directorio)
+    fondo = figure_templates.basemap_raster(region, glm_maps.zoom_level(region),
+                                            frame_size(region, ancho)[0], DPI_ANIMACION)
+    instantes = sorted({glm_backfill.file_time(nombre) for nombre in glm_backfill.load_manifest(region)})
+    instantes = [instante for instante in instantes if inicio <= instante < fin]
+
+    eventos = glm_backfill.load_events(region, inicio, fin)
+    eventos = eventos[np.argsort(eventos['t'], kind='stable')]
+    claves_t = np.array(instantes, dtype='datetime64[m]')
+    desde = np.searchsorted(eventos['t'], claves_t, side='left')
+    hasta = np.searchsorted(eventos['t'], claves_t, side='right')
+
+    rutas, nuevos = [], 0
+    for instante, a, b in zip(instantes, desde, hasta):
+        cuadro = eventos[a:b]
+        ruta = os.path.join(carpeta, f'cuadro_{instante:%Y%m%d%H%M}.png')
+        clave = render_cache.render_key([cuadro['lat'], cuadro['lon'], cuadro['duracion']],
+                                        fondo=os.path.basename(fondo), ancho=ancho, vmax=VMAX_DURACION)
+        if not render_cache.is_fresh(ruta, clave):
+            render_frame(instante, cuadro, region, fondo, ruta, ancho)
+            render_cache.record(ruta, clave)
+            nuevos += 1
+        rutas.append(ruta)
+
+    # Caché rotativa: se borran los cuadros que salieron de la ventana (y sus claves de render)
+    vigentes = set(rutas)
+    for nombre in os.listdir(carpeta):
+        ruta = os.path.join(carpeta, nombre)
+        if nombre.startswith('cuadro_') and nombre.endswith('.png') and ruta not in vigentes:
+            os.remove(ruta)
+            render_cache.forget(ruta)
+    return rutas, nuevos
+
+
+def write_gif(rutas, salida, ms_por_cuadro=MS_POR_CUADRO):
+    """Une los cuadros en un GIF animado (paleta adaptativa por cuadro)."""
+    cuadros = [Image.open(ruta).convert('RGB').convert('P', palette=Image.ADAPTIVE) for ruta in rutas]
+    temporal = salida + '.tmp.gif'
+    cuadros[0].save(temporal, save_all=True, append_images=cuadros[1:], duration=ms_por_cuadro,
+                    loop=0, optimize=True)
+    os.replace(temporal, salida)
+
+
+def write_mp4(rutas, salida, ms_por_cuadro=MS_POR_CUADRO):
+    """Une los cuadros en un MP4 (H.264) con ffmpeg. Retorna False si ffmpeg no está instalado."""
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        print("ffmpeg no está instalado; se omite el MP4.")
+        return False
+    lista = salida + '.txt'
+    with open(lista, 'w') as archivo:
+        for ruta in rutas:
+            archivo.write(f"file '{os.path.abspath(ruta)}'\nduration {ms_por_cuadro / 1000}\n")
+        archivo.write(f"file '{os.path.abspath(rutas[-1])}'\n")  # El demuxer concat ignora la última duración
+    temporal = salida + '.tmp.mp4'
+    subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', lista,
+                    '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2,format=yuv420p', '-movflags', '+faststart',
+                    temporal], check=True)
+    os.remove(lista)
+    os.replace(temporal, salida)
+    return True
+
+
+def output_path(region, extension):
+    return os.path.join(RUTA_GUARDADO, f'GLM_INPE_ANIMACION_{region.nombre}.{extension}')
+
+
+@metrics.job('animacion')
+def update_animation(region=glm_reader.REGIONES['peru'], horas=HORAS_ANIMACION, mp4=False, descargar=True):
+    """
+    Incorpora los archivos nuevos, dibuja solo los cuadros que faltan y rearma la animación.
+    Retorna True si todo salió bien (o no había nada nuevo).
+    """
+    fin = datetime.now(timezone.utc).replace(tzinfo=None)
+    inicio = fin - timedelta(hours=horas)
+    try:
+        if descargar:
+            with metrics.stage('fetch'):
+                glm_backfill.backfill(inicio, fin, region)
+        with metrics.stage('render'), render_cache.PYPLOT_LOCK:
+            rutas, nuevos = update_frames(region, inicio, fin)
+        print(f"Cuadros: {len(rutas)} ({nuevos} nuevos)")
+        if not rutas:
+            print("No hay archivos en la ventana; no se genera la animación.")
+            return False
+
+        salida_gif = output_path(region, 'gif')
+        if nuevos == 0 and os.path.exists(salida_gif) and (not mp4 or os.path.exists(output_path(region, 'mp4'))):
+            print("Sin cuadros nuevos; no se regenera la animación.")
+            return True
+        with metrics.stage('render'):
+            write_gif(rutas, salida_gif)
+            print(f"Animación lista: {salida_gif}")
+            if mp4 and write_mp4(rutas, output_path(region, 'mp4')):
+                print(f"Animación lista: {output_path(region, 'mp4')}")
+        return True
+    except Exception as e:
+        print(f"Error generando la animación: {e}")
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Animación GLM de las últimas horas (CPTEC/INPE)')
+    parser.add_argument('--horas', type=float, default=HORAS_ANIMACION)
+    parser.add_argument('--region', default='peru', choices=sorted(glm_reader.REGIONES))
+    parser.add_argument('--mp4', action='store_true', help='Genera también un MP4 (requiere ffmpeg)')
+    parser.add_argument('--sin-descarga', action='store_true',
+                        help='Usa solo los archivos ya incorporados a la tabla local')
+    args = parser.parse_args()
+    update_animation(glm_reader.REGIONES[args.region], args.horas, args.mp4, not args.sin_descarga)
+
+
+if __name__ == "__main__":
+    main()
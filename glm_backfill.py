@@ -0,0 +1,287 @@
+import argparse
+import asyncio
+import contextvars
+import os
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+
+import netCDF4 as nc
+import numpy as np
+import requests
+from bs4 import BeautifulSoup
+
+import glm_reader
+import http_cache
+import retry
+from swp_paths import data_dir
+
+#=============================================================================
+# Recuperación histórica de archivos GLM y tabla local de flashes
+#
+# Se compara el listado de INPE de cada mes con un manifiesto local, se
+# descargan en paralelo los .nc que faltan y cada uno se reduce a sus puntos
+# con flashes dentro de la región. Los puntos se agregan a una tabla binaria
+# compacta (flashes_<region>.bin) con la que se arman grillas de densidad y
+# series de tasa de rayos sin volver a leer los NetCDF.
+#
+# Cada línea del manifiesto es '<archivo> <bytes de la tabla tras agregarlo>'.
+# La tabla solo es válida hasta el último tamaño registrado: lo que haya más
+# allá (una escritura interrumpida) se descarta al leer y se trunca antes de la
+# siguiente escritura, así un archivo reprocesado nunca queda duplicado. Las
+# escrituras se serializan con un lock de archivo, porque backfill() y el mapa
+# GLM (que agrega el archivo que acaba de leer) pueden escribir a la vez, igual
+# que dos ejecuciones de backfill() (p. ej. una programada y otra manual).
+#=============================================================================
+
+BASE_URL = "http://ftp.cptec.inpe.br/goes/goes16/goes16_web/glm_acumulado_nc/"
+HILOS = 4  # Descargas simultáneas
+
+# Un registro por celda con flashes: instante del archivo, posición, conteo y duración
+EVENTO_DTYPE = np.dtype([('t', 'M8[m]'), ('lat', '<f4'), ('lon', '<f4'),
+                         ('flash', '<f4'), ('duracion', '<f4')])
+
+
+def month_url(year, month):
+    return f"{BASE_URL}{year}/{month:02}/"
+
+
+def file_time(file_name):
+    """Instante (UTC) de un archivo a partir de su nombre, como en el script de graficado."""
+    return datetime.strptime(file_name[10:22], '%Y%m%d%H%M')
+
+
+def list_months(meses):
+    """
+    {(año, mes): nombres de los .nc} de varios meses, pedidos a la vez con retry.call_async:
+    los reintentos de un mes lento no retrasan a los demás. Si el listado de un mes falla,
+    su valor es la excepción (requests.exceptions.RequestException).
+    """
+    async def listar(year, month):
+        url = month_url(year, month)
+        # Listado revalidado con la caché HTTP
+        response = await retry.call_async(http_cache.fetch, url, timeout=10, url=url)
+        soup = BeautifulSoup(response.content, 'html.parser')
+        return [link.get('href') for link in soup.find_all('a') if (link.get('href') or '').endswith('.nc')]
+
+    async def listar_todos():
+        return await asyncio.gather(*(listar(year, month) for year, month in meses), return_exceptions=True)
+
+    resultados = asyncio.run(listar_todos())
+    for resultado in resultados:
+        if isinstance(resultado, Exception) and not isinstance(resultado, requests.exceptions.RequestException):
+            raise resultado
+    return dict(zip(meses, resultados))
+
+
+def _meses(inicio, fin):
+    """(año, mes) de cada mes que toca el intervalo [inicio, fin), cruzando años."""
+    year, month = inicio.year, inicio.month
+    while datetime(year, month, 1) < fin:
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _rutas(region, directorio):
+    directorio = directorio if directorio is not None else data_dir('glm')
+    return (os.path.join(directorio, f'flashes_{region.nombre}.bin'),
+            os.path.join(directorio, f'manifiesto_{region.nombre}.txt'))
+
+
+def _leer_manifiesto(ruta_manifiesto):
+    """(archivos incorporados, bytes válidos de la tabla según la última línea)."""
+    nombres, tamano = set(), 0
+    if not os.path.exists(ruta_manifiesto):
+        return nombres, tamano
+    with open(ruta_manifiesto, 'r') as archivo:
+        for linea in archivo:
+            campos = linea.split()
+            if campos:
+                nombres.add(campos[0])
+                tamano = int(campos[1])
+    return nombres, tamano
+
+
+def load_manifest(region, directorio=None):
+    """Conjunto de archivos ya incorporados a la tabla de la región."""
+    _, ruta_manifiesto = _rutas(region, directorio)
+    return _leer_manifiesto(ruta_manifiesto)[0]
+
+
+@contextmanager
+def _bloqueo(ruta_tabla):
+    """Lock exclusivo entre procesos (e hilos) sobre '<tabla>.lock'."""
+    with open(ruta_tabla + '.lock', 'a+b') as archivo:
+        if os.name == 'nt':
+            import msvcrt
+            archivo.seek(0)
+            msvcrt.locking(archivo.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                archivo.seek(0)
+                msvcrt.locking(archivo.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(archivo, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(archivo, fcntl.LOCK_UN)
+
+
+def points_to_events(instante, flashes):
+    """Convierte los FlashPoints de un archivo en registros EVENTO_DTYPE."""
+    eventos = np.empty(flashes.lats.size, dtype=EVENTO_DTYPE)
+    eventos['t'] = np.datetime64(instante, 'm')
+    eventos['lat'] = flashes.lats
+    eventos['lon'] = flashes.lons
+    eventos['flash'] = flashes.flash
+    eventos['duracion'] = flashes.duracion
+    return eventos
+
+
+def append_events(region, file_name, eventos, directorio=None):
+    """
+    Agrega los eventos de un archivo a la tabla y lo registra en el manifiesto.
+
+    Es idempotente: si el archivo ya está en el manifiesto no se agrega de nuevo.
+    Retorna True si se agregó.
+    """
+    ruta_tabla, ruta_manifiesto = _rutas(region, directorio)
+    with _bloqueo(ruta_tabla):
+        nombres, tamano = _leer_manifiesto(ruta_manifiesto)
+        if file_name in nombres:
+            return False
+        with open(ruta_tabla, 'ab') as archivo:
+            # Eventos de una escritura anterior que no llegó al manifiesto: se descartan
+            if os.fstat(archivo.fileno()).st_size != tamano:
+                archivo.truncate(tamano)
+            eventos.astype(EVENTO_DTYPE, copy=False).tofile(archivo)
+            archivo.flush()
+            os.fsync(archivo.fileno())
+            tamano = os.fstat(archivo.fileno()).st_size
+        # El manifiesto se escribe después de la tabla y registra hasta dónde es válida
+        with open(ruta_manifiesto, 'a') as archivo:
+            archivo.write(f'{file_name} {tamano}\n')
+    return True
+
+
+def _descargar(url, directorio):
+    """Descarga un .nc a disco (por bloques, con reanudación) a un archivo de nombre único y retorna su ruta."""
+    return retry.download_temp(url, directorio, timeout=60)
+
+
+def backfill(inicio, fin, region=glm_reader.REGIONES['peru'], hilos=HILOS, directorio=None):
+    """
+    Incorpora a la tabla todos los archivos de [inicio, fin) que aún no están en el manifiesto.
+
+    Las descargas corren en paralelo (máximo 'hilos') y se escriben a disco por bloques, así que la
+    memoria no crece con el tamaño ni con el número de archivos; la decodificación NetCDF se hace en
+    el hilo que llama y con glm_reader.NETCDF_LOCK, porque netCDF4/HDF5 no es seguro entre hilos.
+    Retorna el número de archivos nuevos.
+    """
+    descargas = data_dir('glm', 'descargas')
+    procesados = load_manifest(region, directorio)
+    pendientes = []
+    for (year, month), nombres in list_months(list(_meses(inicio, fin))).items():
+        if isinstance(nombres, Exception):
+            print(f"Error obteniendo el listado de {year}-{month:02}: {nombres}")
+            continue
+        pendientes += [(month_url(year, month) + nombre, nombre) for nombre in nombres
+                       if nombre not in procesados and inicio <= file_time(nombre) < fin]
+
+    print(f"Archivos por descargar: {len(pendientes)}")
+    nuevos = 0
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        # Cada descarga corre en su propia copia del contexto para sumar a las métricas del trabajo
+        futuros = {pool.submit(contextvars.copy_context().run, _descargar, url, descargas): nombre
+                   for url, nombre in pendientes}
+        for futuro in as_completed(futuros):
+            nombre = futuros[futuro]
+            try:
+                ruta = futuro.result()
+                try:
+                    with glm_reader.NETCDF_LOCK, nc.Dataset(ruta) as dataset:
+                        flashes = glm_reader.read_region(dataset, region)
+                finally:
+                    os.remove(ruta)
+                # Otra ejecución simultánea pudo haberlo incorporado mientras se descargaba
+                if append_events(region, nombre, points_to_events(file_time(nombre), flashes), directorio):
+                    nuevos += 1
+            except Exception as e:
+                print(f"Error procesando {nombre}: {e}")
+    return nuevos
+
+
+def load_events(region=glm_reader.REGIONES['peru'], inicio=None, fin=None, directorio=None):
+    """Eventos de la tabla (memory-mapped) dentro de [inicio, fin)."""
+    ruta_tabla, ruta_manifiesto = _rutas(region, directorio)
+    if not os.path.exists(ruta_tabla):
+        return np.empty(0, dtype=EVENTO_DTYPE)
+    # Solo hasta el último tamaño registrado: lo demás es una escritura en curso o interrumpida
+    _, tamano = _leer_manifiesto(ruta_manifiesto)
+    tamano = min(tamano, os.path.getsize(ruta_tabla))
+    if tamano < EVENTO_DTYPE.itemsize:
+        return np.empty(0, dtype=EVENTO_DTYPE)
+    eventos = np.memmap(ruta_tabla, dtype=EVENTO_DTYPE, mode='r', shape=(tamano // EVENTO_DTYPE.itemsize,))
+    seleccion = np.ones(eventos.size, dtype=bool)
+    if inicio is not None:
+        seleccion &= eventos['t'] >= np.datetime64(inicio, 'm')
+    if fin is not None:
+        seleccion &= eventos['t'] < np.datetime64(fin, 'm')
+    return np.asarray(eventos[seleccion])
+
+
+def density_cube(eventos, region, inicio, fin, paso='h', resolucion=0.1, pesos='flash'):
+    """
+    Grillas de densidad de flashes por periodo en un solo bincount.
+
+    'paso' es la unidad de numpy del periodo ('h' horario, 'D' diario). 'pesos' es el
+    campo que se acumula ('flash', 'duracion') o None para contar celdas.
+    Retorna (periodos datetime64, bordes_lat, bordes_lon, cubo (periodos, lat, lon)).
+    """
+    periodos = np.arange(np.datetime64(inicio, paso), np.datetime64(fin, paso), dtype=f'datetime64[{paso}]')
+    bordes_lat, bordes_lon = glm_reader.grid_edges(region, resolucion)
+    i_lat, i_lon, validos, nlat, nlon = glm_reader.cell_indices(eventos['lat'], eventos['lon'], region, resolucion)
+    if not periodos.size:
+        return periodos, bordes_lat, bordes_lon, np.zeros((0, nlat, nlon))
+
+    i_t = (eventos['t'].astype(f'datetime64[{paso}]') - periodos[0]).astype(np.int64)
+    validos &= (i_t >= 0) & (i_t < periodos.size)
+
+    indice = (i_t[validos] * nlat + i_lat[validos]) * nlon + i_lon[validos]
+    w = None if pesos is None else np.nan_to_num(eventos[pesos][validos].astype(np.float64))
+    cubo = np.bincount(indice, weights=w, minlength=periodos.size * nlat * nlon)
+    return periodos, bordes_lat, bordes_lon, cubo.reshape(periodos.size, nlat, nlon)
+
+
+def rate_series(eventos, inicio, fin, paso='h', pesos='flash'):
+    """Serie de tasa de rayos: total de 'pesos' (o número de celdas) por periodo."""
+    periodos = np.arange(np.datetime64(inicio, paso), np.datetime64(fin, paso), dtype=f'datetime64[{paso}]')
+    if not periodos.size:
+        return periodos, np.empty(0)
+    i_t = (eventos['t'].astype(f'datetime64[{paso}]') - periodos[0]).astype(np.int64)
+    validos = (i_t >= 0) & (i_t < periodos.size)
+    w = None if pesos is None else np.nan_to_num(eventos[pesos][validos].astype(np.float64))
+    return periodos, np.bincount(i_t[validos], weights=w, minlength=periodos.size).astype(np.float64)
+
+
+def main():
+    ahora = datetime.now(timezone.utc).replace(tzinfo=None)
+    parser = argparse.ArgumentParser(description='Recuperación histórica de archivos GLM (CPTEC/INPE)')
+    parser.add_argument('--desde', default=(ahora - timedelta(days=1)).strftime('%Y-%m-%d'),
+                        help='Fecha inicial UTC (yyyy-mm-dd o yyyy-mm-ddTHH:MM)')
+    parser.add_argument('--hasta', default=None, help='Fecha final UTC, exclusiva (por defecto: ahora)')
+    parser.add_argument('--region', default='peru', choices=sorted(glm_reader.REGIONES))
+    parser.add_argument('--hilos', type=int, default=HILOS)
+    args = parser.parse_args()
+
+    inicio = datetime.fromisoformat(args.desde)
+    fin = datetime.fromisoformat(args.hasta) if args.hasta else ahora
+    nuevos = backfill(inicio, fin, glm_reader.REGIONES[args.region], hilos=args.hilos)
+    print(f"Archivos incorporados: {nuevos}")
+
+
+if __name__ == "__main__":
+    main()
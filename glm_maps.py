@@ -0,0 +1,47 @@
+import functools
+import os
+
+import cartopy.feature as cfeature
+import cartopy.io.img_tiles as cimgt
+
+import glm_reader
+
+#=============================================================================
+# Fuentes del mapa base de los gráficos GLM (teselas OSM y Natural Earth)
+#
+# Lo comparten el script de graficado, la animación y figure_templates, así
+# que vive en un módulo propio: ninguno de ellos importa el script de cron.
+#=============================================================================
+
+ZOOM_OSM = {'sudamerica': 4}  # Nivel de teselas OSM por región
+ZOOM_DEFECTO = 6
+
+
+def zoom_level(region):
+    """Nivel de teselas OSM para una región."""
+    return ZOOM_OSM.get(region.nombre, ZOOM_DEFECTO)
+
+
+@functools.lru_cache(maxsize=None)
+def osm_tiles():
+    """Fuente de teselas OSM con caché en disco (una por proceso)."""
+    cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'tiles')
+    os.makedirs(cache_dir, exist_ok=True)
+    return cimgt.OSM(cache=cache_dir)
+
+
+def warm_up(regiones):
+    """
+    Precarga en memoria las geometrías de Natural Earth (costas y fronteras) de las
+    regiones (nombres de glm_reader.REGIONES), para que un proceso residente no las
+    vuelva a leer en cada mapa.
+    """
+    for nombre in regiones:
+        region = glm_reader.REGIONES[nombre]
+        extent = (region.lon_min, region.lon_max, region.lat_min, region.lat_max)
+        for feature in (cfeature.COASTLINE, cfeature.BORDERS):
+            try:
+                list(feature.intersecting_geometries(extent))
+            except Exception as e:
+                print(f"No se pudo precargar {feature.name} para {nombre}: {e}")
+    osm_tiles()
@@ -0,0 +1,142 @@
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+#=============================================================================
+# Lectura de archivos GLM acumulados (INPE) solo para la región de interés
+#
+# En lugar de leer la grilla completa con [:] y recortar con índices "fancy",
+# se calculan una vez los límites contiguos lat/lon de la región para cada
+# geometría de grilla y se lee solo ese hiperrectángulo del NetCDF.
+#=============================================================================
+
+Region = namedtuple('Region', ['nombre', 'lat_min', 'lat_max', 'lon_min', 'lon_max'])
+
+# Regiones disponibles (grados; latitudes sur y longitudes oeste negativas)
+REGIONES = {
+    'peru': Region('peru', -19.2, 0.7, -82.1, -68.10),
+    'arequipa': Region('arequipa', -17.4, -14.5, -75.2, -70.7),
+    'loreto': Region('loreto', -8.8, 0.1, -78.0, -69.8),
+    'sudamerica': Region('sudamerica', -56.0, 13.0, -82.0, -34.0),
+}
+
+FlashPoints = namedtuple('FlashPoints', ['lats', 'lons', 'flash', 'duracion'])
+
+# Límites (slice_lat, slice_lon) por (geometría de grilla, región)
+_LIMITES = {}
+
+# netCDF4/HDF5 no es seguro entre hilos: bajo swp_daemon el mapa GLM y la animación
+# pueden decodificar archivos a la vez, así que abrir y leer un .nc se hace con este lock
+NETCDF_LOCK = threading.Lock()
+
+
+def _geometria(coord):
+    return (int(coord.size), float(coord[0]), float(coord[-1]))
+
+
+def _slice_contiguo(coord, vmin, vmax):
+    """Slice que cubre los valores de 'coord' (monótona) dentro de [vmin, vmax]."""
+    indices = np.flatnonzero((coord >= vmin) & (coord <= vmax))
+    if indices.size == 0:
+        return slice(0, 0)
+    return slice(int(indices[0]), int(indices[-1]) + 1)
+
+
+def slice_bounds(lat, lon, region):
+    """Retorna (slice_lat, slice_lon) de la región, calculados una sola vez por geometría."""
+    clave = (_geometria(lat), _geometria(lon), tuple(region[1:]))
+    limites = _LIMITES.get(clave)
+    if limites is None:
+        limites = (_slice_contiguo(lat, region.lat_min, region.lat_max),
+                   _slice_contiguo(lon, region.lon_min, region.lon_max))
+        _LIMITES[clave] = limites
+    return limites
+
+
+def bounding_region(regiones):
+    """Región mínima que contiene a todas las dadas (para leer el archivo una sola vez)."""
+    if len(regiones) == 1:
+        return regiones[0]
+    return Region('+'.join(r.nombre for r in regiones),
+                  min(r.lat_min for r in regiones), max(r.lat_max for r in regiones),
+                  min(r.lon_min for r in regiones), max(r.lon_max for r in regiones))
+
+
+def clip_points(flashes, region):
+    """Los FlashPoints que caen dentro de 'region' (p. ej. de una lectura de bounding_region)."""
+    dentro = ((flashes.lats >= region.lat_min) & (flashes.lats <= region.lat_max)
+              & (flashes.lons >= region.lon_min) & (flashes.lons <= region.lon_max))
+    return FlashPoints(*(campo[dentro] for campo in flashes))
+
+
+def _tamano_grilla(region, resolucion):
+    return (max(1, int(np.ceil(round((region.lat_max - region.lat_min) / resolucion, 9)))),
+            max(1, int(np.ceil(round((region.lon_max - region.lon_min) / resolucion, 9)))))
+
+
+def cell_indices(lats, lons, region, resolucion):
+    """
+    Índices de celda (i_lat, i_lon) de cada punto en una grilla regular de la región.
+
+    Retorna (i_lat, i_lon, validos, nlat, nlon); los puntos en el borde superior se
+    asignan a la última celda y los que caen fuera quedan con validos=False.
+    """
+    nlat, nlon = _tamano_grilla(region, resolucion)
+    i_lat = np.floor((np.asarray(lats, dtype=np.float64) - region.lat_min) / resolucion).astype(np.int64)
+    i_lon = np.floor((np.asarray(lons, dtype=np.float64) - region.lon_min) / resolucion).astype(np.int64)
+    i_lat = np.where(np.asarray(lats) == region.lat_max, nlat - 1, i_lat)
+    i_lon = np.where(np.asarray(lons) == region.lon_max, nlon - 1, i_lon)
+    validos = (i_lat >= 0) & (i_lat < nlat) & (i_lon >= 0) & (i_lon < nlon)
+    return i_lat, i_lon, validos, nlat, nlon
+
+
+def grid_edges(region, resolucion):
+    """Bordes (lat, lon) de la grilla regular usada por cell_indices."""
+    nlat, nlon = _tamano_grilla(region, resolucion)
+    return (region.lat_min + resolucion * np.arange(nlat + 1),
+            region.lon_min + resolucion * np.arange(nlon + 1))
+
+
+def density_grid(lats, lons, region, resolucion=0.1, pesos=None):
+    """
+    Densidad de flashes en una grilla regular con un solo bincount.
+
+    'pesos' (p. ej. la duración de cada punto) se suma por celda; sin pesos se cuentan
+    puntos. Retorna (bordes_lat, bordes_lon, grilla (nlat, nlon)).
+    """
+    i_lat, i_lon, validos, nlat, nlon = cell_indices(lats, lons, region, resolucion)
+    w = None if pesos is None else np.nan_to_num(np.asarray(pesos, dtype=np.float64)[validos])
+    grilla = np.bincount(i_lat[validos] * nlon + i_lon[validos], weights=w, minlength=nlat * nlon)
+    bordes_lat, bordes_lon = grid_edges(region, resolucion)
+    return bordes_lat, bordes_lon, grilla.reshape(nlat, nlon)
+
+
+def _coordenada(dataset, nombre):
+    return np.ma.filled(dataset.variables[nombre][:].astype(np.float64), np.nan)
+
+
+def read_region(dataset, region, variable='flash', variable_duracion='duration_flash'):
+    """
+    Lee los puntos con flashes (> 0) de la región desde un netCDF4.Dataset abierto.
+
+    Solo se leen del archivo los hiperrectángulos de 'variable' y 'variable_duracion'
+    que cubren la región; las celdas enmascaradas cuentan como sin flashes.
+    """
+    lat = _coordenada(dataset, 'lat')
+    lon = _coordenada(dataset, 'lon')
+    slice_lat, slice_lon = slice_bounds(lat, lon, region)
+
+    var_flash = dataset.variables[variable]
+    ventana = (slice(None),) * (var_flash.ndim - 2) + (slice_lat, slice_lon)
+    flash = np.ma.filled(var_flash[ventana], 0)
+    seleccion = np.nonzero(flash > 0)
+    if not seleccion[0].size:
+        vacio = np.empty(0, dtype=np.float64)
+        return FlashPoints(vacio, vacio, vacio, vacio)
+
+    duracion = np.ma.filled(dataset.variables[variable_duracion][ventana].astype(np.float64), np.nan)
+    return FlashPoints(lats=lat[slice_lat][seleccion[-2]],
+                       lons=lon[slice_lon][seleccion[-1]],
+                       flash=flash[seleccion].astype(np.float64),
+                       duracion=duracion[seleccion])
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import threading
+from collections import namedtuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from swp_paths import data_dir
+
+#=============================================================================
+# Capa común de descarga para los scripts Dst, Kp y GLM
+#
+# - Una sola requests.Session con pool de conexiones por proceso.
+# - Caché en disco por URL (cuerpo + ETag/Last-Modified) bajo ~/.cache/swp/http.
+# - Revalidación con If-None-Match / If-Modified-Since: si el servidor responde
+#   304, o el cuerpo es idéntico al anterior, 'modified' es False y el script
+#   puede saltarse el parseo y el graficado.
+#=============================================================================
+
+TIMEOUT = 10  # segundos
+TAMANO_POOL = 16
+
+FetchResult = namedtuple('FetchResult', ['url', 'content', 'status', 'modified', 'from_cache'])
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Retorna la sesión HTTP compartida (creada al primer uso)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=TAMANO_POOL, pool_maxsize=TAMANO_POOL)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+    return _session
+
+
+def _rutas(url, directorio):
+    directorio = directorio if directorio is not None else data_dir('http')
+    clave = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    base = os.path.join(directorio, clave)
+    return base + '.json', base + '.body'
+
+
+def _leer_meta(ruta_meta, ruta_cuerpo):
+    if not (os.path.exists(ruta_meta) and os.path.exists(ruta_cuerpo)):
+        return None
+    try:
+        with open(ruta_meta, 'r') as archivo:
+            return json.load(archivo)
+    except (OSError, ValueError):
+        return None
+
+
+def _escribir_atomico(ruta, datos, modo='wb'):
+    temporal = f'{ruta}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporal, modo) as archivo:
+        archivo.write(datos)
+    os.replace(temporal, ruta)
+
+
+def fetch(url, timeout=TIMEOUT, cache=True, directorio=None, session=None):
+    """
+    Descarga 'url' revalidando contra la caché en disco.
+
+    Con cache=False solo se usa la sesión compartida (archivos grandes que no se
+    vuelven a pedir). Lanza requests.exceptions.RequestException si falla.
+    """
+    session = session if session is not None else get_session()
+    if not cache:
+        response = session.get(url, timeout=timeout)
+        response.raise_for_status()
+        metrics.increment('bytes_descargados', len(response.content))
+        return FetchResult(url, response.content, response.status_code, True, False)
+
+    ruta_meta, ruta_cuerpo = _rutas(url, directorio)
+    meta = _leer_meta(ruta_meta, ruta_cuerpo)
+
+    headers = {}
+    if meta:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    response = session.get(url, headers=headers, timeout=timeout)
+
+    # Camino rápido: el servidor confirma que no hubo cambios
+    if response.status_code == 304 and meta:
+        metrics.increment('cache_hits')
+        with open(ruta_cuerpo, 'rb') as archivo:
+            return FetchResult(url, archivo.read(), 304, False, True)
+
+    response.raise_for_status()
+    content = response.content
+    digest = hashlib.sha256(content).hexdigest()
+    modified = not meta or meta.get('sha256') != digest
+    metrics.increment('bytes_descargados', len(content))
+    if not modified:
+        metrics.increment('cache_hits')
+
+    # Servidores sin validadores: el cuerpo idéntico también cuenta como "sin cambios"
+    if modified:
+        _escribir_atomico(ruta_cuerpo, content)
+    nueva_meta = {
+        'url': url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'sha256': digest,
+    }
+    if nueva_meta != meta:
+        _escribir_atomico(ruta_meta, json.dumps(nueva_meta), modo='w')
+    return FetchResult(url, content, response.status_code, modified, False)
+
+
+def invalidate(url, directorio=None):
+    """
+    Olvida la respuesta guardada para 'url'.
+
+    Se usa cuando el procesamiento posterior falla, para que la siguiente ejecución
+    no tome el camino rápido de "sin cambios" con datos que nunca se graficaron.
+    """
+    for ruta in _rutas(url, directorio):
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,135 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from swp_paths import data_dir
+
+#=============================================================================
+# Métricas por ejecución de los trabajos Dst, Kp y GLM
+#
+# Cada ejecución (función decorada con @job) acumula el tiempo de sus etapas
+# (fetch, parse, subset, render) y contadores (bytes descargados, aciertos de
+# caché, reintentos, valores NaN). Al terminar se agrega una línea JSON a
+# ~/.cache/swp/metricas/metricas.jsonl y, si SWP_PROMETHEUS_DIR está definido,
+# se reescribe swp_<trabajo>.prom en formato de texto de Prometheus (para el
+# textfile collector de node_exporter).
+#=============================================================================
+
+ARCHIVO_JSONL = 'metricas.jsonl'
+TAMANO_MAXIMO = 5 * 2 ** 20  # Al superarlo, el archivo se rota a metricas.jsonl.1
+DIRECTORIO_PROMETHEUS = os.environ.get('SWP_PROMETHEUS_DIR')
+
+_lock = threading.Lock()
+
+
+def _nuevo():
+    return {'etapas': {}, 'contadores': {}}
+
+
+# Métricas de la ejecución en curso. Es una variable de contexto para que varios trabajos
+# puedan correr a la vez (en hilos de swp_daemon) sin mezclar sus métricas; los hilos
+# auxiliares de un trabajo deben copiar el contexto (contextvars.copy_context().run).
+# Fuera de un trabajo no hay métricas en curso y stage/increment no registran nada.
+_actual = contextvars.ContextVar('metricas', default=None)
+
+
+@contextmanager
+def stage(nombre):
+    """Mide una etapa de la ejecución en curso; si se repite, los tiempos se suman."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        datos = _actual.get()
+        if datos is not None:
+            etapas = datos['etapas']
+            with _lock:
+                etapas[nombre] = etapas.get(nombre, 0.0) + time.perf_counter() - inicio
+
+
+def increment(nombre, valor=1):
+    """Suma 'valor' al contador 'nombre' de la ejecución en curso."""
+    datos = _actual.get()
+    if datos is None:
+        return
+    contadores = datos['contadores']
+    with _lock:
+        contadores[nombre] = contadores.get(nombre, 0) + valor
+
+
+def _rotar(ruta):
+    if os.path.exists(ruta) and os.path.getsize(ruta) > TAMANO_MAXIMO:
+        os.replace(ruta, ruta + '.1')
+
+
+def _prometheus(registro, directorio):
+    etiqueta = f'trabajo="{registro["trabajo"]}"'
+    lineas = ['# TYPE swp_ejecucion_segundos gauge',
+              f'swp_ejecucion_segundos{{{etiqueta}}} {registro["duracion_s"]}',
+              '# TYPE swp_ejecucion_ok gauge',
+              f'swp_ejecucion_ok{{{etiqueta}}} {int(registro["ok"])}',
+              '# TYPE swp_ultima_ejecucion_timestamp_segundos gauge',
+              f'swp_ultima_ejecucion_timestamp_segundos{{{etiqueta}}} {registro["fin_unix"]}',
+              '# TYPE swp_etapa_segundos gauge']
+    lineas += [f'swp_etapa_segundos{{{etiqueta},etapa="{nombre}"}} {segundos}'
+               for nombre, segundos in sorted(registro['etapas'].items())]
+    lineas.append('# TYPE swp_contador gauge')
+    lineas += [f'swp_contador{{{etiqueta},nombre="{nombre}"}} {valor}'
+               for nombre, valor in sorted(registro['contadores'].items())]
+
+    ruta = os.path.join(directorio, f'swp_{registro["trabajo"]}.prom')
+    temporal = ruta + '.tmp'
+    with open(temporal, 'w') as archivo:
+        archivo.write('\n'.join(lineas) + '\n')
+    os.replace(temporal, ruta)  # El collector nunca ve un archivo a medio escribir
+
+
+def write(trabajo, duracion, ok, datos, directorio=None, directorio_prometheus=DIRECTORIO_PROMETHEUS):
+    """Agrega el registro de una ejecución al JSONL (y al .prom si está configurado)."""
+    registro = {'trabajo': trabajo,
+                'fin': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'fin_unix': round(time.time(), 3),
+                'duracion_s': round(duracion, 4),
+                'ok': ok,
+                'etapas': {nombre: round(segundos, 4) for nombre, segundos in datos['etapas'].items()},
+                'contadores': dict(datos['contadores'])}
+    try:
+        ruta = os.path.join(directorio if directorio is not None else data_dir('metricas'), ARCHIVO_JSONL)
+        _rotar(ruta)
+        with open(ruta, 'a') as archivo:
+            archivo.write(json.dumps(registro, sort_keys=True) + '\n')
+        if directorio_prometheus:
+            os.makedirs(directorio_prometheus, exist_ok=True)
+            _prometheus(registro, directorio_prometheus)
+    except OSError as e:
+        # Las métricas nunca deben tumbar un trabajo
+        print(f"No se pudieron guardar las métricas de {trabajo}: {e}")
+    return registro
+
+
+def job(trabajo):
+    """
+    Decorador para la función principal de un trabajo: reinicia las métricas, ejecuta y
+    registra el resultado (ok salvo que la función retorne False o lance una excepción).
+    """
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            token = _actual.set(_nuevo())
+            inicio = time.perf_counter()
+            ok = False
+            try:
+                resultado = funcion(*args, **kwargs)
+                ok = resultado is not False
+                return resultado
+            finally:
+                datos = _actual.get()
+                _actual.reset(token)
+                write(trabajo, time.perf_counter() - inicio, ok, datos)
+        return envoltura
+    return decorador
@@ -0,0 +1,119 @@
+import io
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+import metrics
+
+#=============================================================================
+# Salidas en varios tamaños y formatos a partir de un solo render
+#
+# La figura se dibuja una vez (savefig a un PNG en memoria sin comprimir) y
+# Pillow escribe en paralelo las variantes configuradas: el PNG a resolución
+# completa (misma ruta de siempre, compresión optimizada), una versión web
+# (WebP) y una miniatura. Una variante cuyo contenido es idéntico al del
+# archivo existente no se reescribe, así el archivo no cambia en disco ni
+# aparece como modificado en git.
+#
+# Las variantes adicionales son opcionales y se eligen con SWP_VARIANTES
+# (p. ej. "web,miniatura"); por defecto solo se escribe el PNG completo, que es
+# la ruta que usan la caché de render y los enlaces existentes. Cada variante
+# se escribe junto al PNG con un sufijo ('DST.png' -> 'DST_web.webp',
+# 'DST_mini.png'): para publicarlas basta definir SWP_VARIANTES en el workflow,
+# que las sube al repositorio con el resto de las salidas, y enlazar esos
+# nombres desde la página.
+#
+# optimize achica el PNG completo, pero codificarlo cuesta casi tanto como el
+# render (~0.26 s contra ~0.31 s en Dst); SWP_PNG_OPTIMIZAR=0 lo desactiva.
+#=============================================================================
+
+# sufijo: se agrega al nombre base; ancho: píxeles (None = resolución del render)
+Variante = namedtuple('Variante', ['sufijo', 'formato', 'extension', 'ancho', 'opciones'])
+
+PNG_OPTIMIZAR = os.environ.get('SWP_PNG_OPTIMIZAR', '1') != '0'
+
+VARIANTES = {
+    'completa': Variante('', 'PNG', 'png', None, {'optimize': PNG_OPTIMIZAR}),
+    'web': Variante('_web', 'WEBP', 'webp', 1200, {'quality': 85, 'method': 6}),
+    'miniatura': Variante('_mini', 'PNG', 'png', 320, {'optimize': True}),
+}
+VARIANTES_ADICIONALES = [nombre.strip() for nombre in os.environ.get('SWP_VARIANTES', '').split(',')
+                         if nombre.strip() in VARIANTES and nombre.strip() != 'completa']
+
+
+def variant_path(ruta, variante):
+    """Ruta de una variante: 'DST.png' -> 'DST_web.webp'."""
+    base, _ = os.path.splitext(ruta)
+    return f'{base}{variante.sufijo}.{variante.extension}'
+
+
+def render_image(fig, **kwargs):
+    """Dibuja la figura una sola vez (mismos argumentos que savefig) y la retorna como imagen PIL."""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', pil_kwargs={'compress_level': 0}, **kwargs)
+    buffer.seek(0)
+    imagen = Image.open(buffer)
+    imagen.load()
+    # Las figuras son opacas: sin el canal alfa los archivos son más livianos
+    if imagen.mode == 'RGBA' and imagen.getextrema()[3] == (255, 255):
+        imagen = imagen.convert('RGB')
+    return imagen
+
+
+def encode(imagen, variante):
+    """Bytes de la variante: redimensionada (si corresponde) y codificada."""
+    if variante.ancho is not None and imagen.width > variante.ancho:
+        alto = round(imagen.height * variante.ancho / imagen.width)
+        imagen = imagen.resize((variante.ancho, alto), Image.LANCZOS)
+    buffer = io.BytesIO()
+    imagen.save(buffer, format=variante.formato, **variante.opciones)
+    return buffer.getvalue()
+
+
+def _mismo_contenido(ruta, datos):
+    if not os.path.exists(ruta) or os.path.getsize(ruta) != len(datos):
+        return False
+    with open(ruta, 'rb') as archivo:
+        return archivo.read() == datos
+
+
+def _escribir(imagen, variante, ruta):
+    """Codifica y escribe una variante. Retorna los bytes escritos (0 si no cambió)."""
+    datos = encode(imagen, variante)
+    if _mismo_contenido(ruta, datos):
+        return 0
+    temporal = ruta + '.tmp'
+    with open(temporal, 'wb') as archivo:
+        archivo.write(datos)
+    os.replace(temporal, ruta)
+    return len(datos)
+
+
+def write_variants(imagen, ruta, variantes=None):
+    """
+    Escribe las variantes de 'imagen' junto a 'ruta' en paralelo (Pillow libera el GIL al
+    redimensionar y comprimir). Retorna {ruta de la variante: bytes escritos, 0 si se omitió}.
+    """
+    if variantes is None:
+        variantes = [VARIANTES['completa']] + [VARIANTES[nombre] for nombre in VARIANTES_ADICIONALES]
+    rutas = [variant_path(ruta, variante) for variante in variantes]
+    with ThreadPoolExecutor(max_workers=max(len(variantes), 1)) as pool:
+        escritos = list(pool.map(_escribir, [imagen] * len(variantes), variantes, rutas))
+
+    # Los contadores se suman aquí: los hilos del pool no ven el contexto del trabajo
+    metrics.increment('bytes_escritos', sum(escritos))
+    metrics.increment('salidas_sin_cambios', escritos.count(0))
+    return dict(zip(rutas, escritos))
+
+
+def save_figure(fig, ruta, variantes=None, **kwargs):
+    """Reemplazo de fig.savefig(ruta, **kwargs) que genera todas las variantes de un solo render."""
+    resultado = write_variants(render_image(fig, **kwargs), ruta, variantes)
+    for salida, escritos in resultado.items():
+        if escritos:
+            print(f"Guardado: {salida} ({escritos / 1024:.0f} KB)")
+        else:
+            print(f"Sin cambios: {salida}")
+    return resultado
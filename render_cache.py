@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from swp_paths import data_dir
+
+#=============================================================================
+# Caché de renderizado: antes de graficar se calcula un hash de los arreglos
+# que se dibujan y de los parámetros del gráfico (título, extensión, dpi...).
+# Si coincide con el del último PNG guardado en esa ruta, se omite todo el
+# trabajo de matplotlib/cartopy.
+#=============================================================================
+
+# pyplot no es seguro entre hilos: cuando varios trabajos corren a la vez en el
+# mismo proceso (swp_daemon), sus gráficos se dibujan de a uno.
+PYPLOT_LOCK = threading.RLock()
+
+
+def render_key(arrays, **params):
+    """Hash (hex) de los arreglos graficados y de los parámetros del gráfico."""
+    h = hashlib.sha256()
+    for arreglo in arrays:
+        if np.ma.isMaskedArray(arreglo):
+            # Los valores enmascarados no se dibujan: se normalizan antes del hash
+            h.update(np.ascontiguousarray(np.ma.getmaskarray(arreglo)).tobytes())
+            arreglo = np.ma.filled(arreglo, 0)
+        arreglo = np.ascontiguousarray(arreglo)
+        h.update(f'{arreglo.dtype.str}{arreglo.shape}'.encode('ascii'))
+        h.update(arreglo.tobytes())
+    h.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+    return h.hexdigest()
+
+
+def _ruta_clave(ruta_salida, directorio):
+    directorio = directorio if directorio is not None else data_dir('render')
+    nombre = hashlib.sha256(os.path.abspath(ruta_salida).encode('utf-8')).hexdigest()
+    return os.path.join(directorio, nombre + '.key')
+
+
+def is_fresh(ruta_salida, clave, directorio=None):
+    """True si 'ruta_salida' existe y fue generada con la misma clave."""
+    if not os.path.exists(ruta_salida):
+        return False
+    try:
+        with open(_ruta_clave(ruta_salida, directorio), 'r') as archivo:
+            return archivo.read().strip() == clave
+    except OSError:
+        return False
+
+
+def record(ruta_salida, clave, directorio=None):
+    """Registra la clave con la que se generó 'ruta_salida' (llamar después de savefig)."""
+    with open(_ruta_clave(ruta_salida, directorio), 'w') as archivo:
+        archivo.write(clave)
+
+
+def forget(ruta_salida, directorio=None):
+    """Borra la clave registrada para 'ruta_salida' (llamar al borrar esa salida)."""
+    try:
+        os.remove(_ruta_clave(ruta_salida, directorio))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,153 @@
+import asyncio
+import inspect
+import os
+import random
+import tempfile
+import time
+
+import requests
+
+import http_cache
+import metrics
+
+#=============================================================================
+# Reintentos comunes para Kyoto, GFZ e INPE
+#
+# - Espera exponencial con jitter entre intentos y un plazo total: ningún
+#   trabajo se queda dormido minutos dentro de una ejecución.
+# - Solo se reintentan errores transitorios (conexión, timeout, 5xx, 429).
+# - Descargas grandes (.nc) con reanudación por HTTP Range: si la conexión se
+#   corta, el siguiente intento pide solo los bytes que faltan. download_temp()
+#   escribe por bloques directo a disco, sin copias del archivo en memoria, en
+#   un archivo con nombre único: dos trabajos que bajan el mismo .nc a la vez
+#   (p. ej. el mapa GLM y la animación) nunca comparten ni borran el archivo
+#   del otro.
+# - Variante asyncio de call(), para reintentar sin bloquear un event loop.
+#=============================================================================
+
+INTENTOS = 4
+ESPERA_BASE = 1.0  # segundos; se duplica en cada intento
+ESPERA_MAXIMA = 20.0
+PLAZO = 90.0  # segundos en total para todos los intentos
+TAMANO_BLOQUE = 1 << 20  # Bytes por bloque en las descargas por partes
+
+
+def is_transient(error):
+    """True si vale la pena reintentar después de 'error'."""
+    if isinstance(error, requests.exceptions.HTTPError):
+        respuesta = error.response
+        return respuesta is None or respuesta.status_code == 429 or respuesta.status_code >= 500
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                              requests.exceptions.ChunkedEncodingError))
+
+
+def delays(intentos=INTENTOS, espera_base=ESPERA_BASE, espera_maxima=ESPERA_MAXIMA):
+    """Esperas antes de cada reintento: exponencial con 'full jitter'."""
+    for intento in range(intentos - 1):
+        yield random.uniform(0, min(espera_maxima, espera_base * 2 ** intento))
+
+
+def _siguiente_espera(error, esperas, limite, url):
+    """Espera antes del próximo intento, o None si hay que rendirse."""
+    if not is_transient(error):
+        return None
+    espera = next(esperas, None)
+    if espera is None or time.monotonic() + espera >= limite:
+        return None
+    metrics.increment('reintentos')
+    print(f"Error transitorio{f' en {url}' if url else ''}: {error}. Reintentando en {espera:.1f} s")
+    return espera
+
+
+def call(funcion, *args, intentos=INTENTOS, plazo=PLAZO, url=None, **kwargs):
+    """
+    Ejecuta funcion(*args, **kwargs) reintentando los errores transitorios.
+
+    Se rinde al agotar los intentos o cuando la próxima espera pasaría el plazo total;
+    en ese caso (o ante un error no transitorio) relanza la última excepción.
+    """
+    limite = time.monotonic() + plazo
+    esperas = delays(intentos)
+    while True:
+        try:
+            return funcion(*args, **kwargs)
+        except requests.exceptions.RequestException as e:
+            espera = _siguiente_espera(e, esperas, limite, url)
+            if espera is None:
+                raise
+            time.sleep(espera)
+
+
+async def call_async(funcion, *args, intentos=INTENTOS, plazo=PLAZO, url=None, **kwargs):
+    """Como call(), sin bloquear el event loop: las funciones síncronas corren en un hilo."""
+    limite = time.monotonic() + plazo
+    esperas = delays(intentos)
+    while True:
+        try:
+            if inspect.iscoroutinefunction(funcion):
+                return await funcion(*args, **kwargs)
+            return await asyncio.to_thread(funcion, *args, **kwargs)
+        except requests.exceptions.RequestException as e:
+            espera = _siguiente_espera(e, esperas, limite, url)
+            if espera is None:
+                raise
+            await asyncio.sleep(espera)
+
+
+def _descargar_desde(url, destino, timeout):
+    """Un intento: continúa en 'destino' desde los bytes que ya tiene."""
+    inicio = destino.tell()
+    headers = {'Range': f'bytes={inicio}-'} if inicio else {}
+    with http_cache.get_session().get(url, headers=headers, timeout=timeout, stream=True) as response:
+        if inicio and response.status_code == 416:
+            return  # Ya estaba completo
+        response.raise_for_status()
+        if inicio and response.status_code != 206:
+            # El servidor no acepta Range: se empieza de nuevo
+            destino.seek(0)
+            destino.truncate()
+        for bloque in response.iter_content(TAMANO_BLOQUE):
+            destino.write(bloque)
+            metrics.increment('bytes_descargados', len(bloque))
+
+
+def download(url, destino, timeout=30, intentos=INTENTOS, plazo=PLAZO):
+    """
+    Descarga 'url' en el archivo binario 'destino' (p. ej. io.BytesIO) con reanudación.
+
+    Cada reintento pide 'Range: bytes=<recibidos>-' en lugar de volver a bajar todo el
+    archivo. Retorna el número de bytes escritos.
+    """
+    call(_descargar_desde, url, destino, timeout, intentos=intentos, plazo=plazo, url=url)
+    return destino.tell()
+
+
+def download_temp(url, directorio, timeout=30, intentos=INTENTOS, plazo=PLAZO):
+    """
+    Descarga 'url' por bloques (memoria constante) a un archivo de nombre único en 'directorio'.
+
+    El nombre sale de tempfile.mkstemp y conserva la extensión (p. ej. '<nombre>.k3j9x.nc'), así
+    que descargas simultáneas de la misma URL no se pisan. Retorna la ruta del archivo completo;
+    quien llama debe borrarlo. Si la descarga falla, el archivo parcial se borra.
+    """
+    base, extension = os.path.splitext(url.split('/')[-1])
+    descriptor, ruta = tempfile.mkstemp(suffix=extension, prefix=base + '.', dir=directorio)
+    try:
+        with os.fdopen(descriptor, 'wb') as destino:
+            download(url, destino, timeout=timeout, intentos=intentos, plazo=plazo)
+    except BaseException:
+        os.remove(ruta)
+        raise
+    return ruta
+
+
+def download_file(url, ruta, timeout=30, intentos=INTENTOS, plazo=PLAZO):
+    """
+    Descarga 'url' a 'ruta' por bloques. Se escribe en un archivo temporal único del mismo
+    directorio y se renombra al completarse, así 'ruta' nunca queda a medio escribir. Retorna 'ruta'.
+    """
+    temporal = download_temp(url, os.path.dirname(os.path.abspath(ruta)), timeout=timeout,
+                             intentos=intentos, plazo=plazo)
+    os.replace(temporal, ruta)
+    return ruta
+
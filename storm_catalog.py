@@ -0,0 +1,195 @@
+import argparse
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+
+import dst_store
+import gfz_client
+from swp_paths import data_dir
+
+#=============================================================================
+# Catálogo histórico de tormentas geomagnéticas (Dst y Kp)
+#
+# Se recorre toda la serie guardada localmente (archivo Dst de dst_store y
+# caché Kp de gfz_client) y se detectan las tormentas con rachas vectorizadas:
+# inicio (primer valor que cruza el umbral), fase principal (hasta el extremo),
+# mínimo de Dst / máximo de Kp y recuperación (hasta que vuelve bajo el umbral).
+# Cada evento se clasifica con los mismos umbrales de las bandas de los gráficos
+# y la tabla se guarda ordenada por inicio en tormentas.npy, de modo que una
+# consulta por fechas es un searchsorted y no vuelve a leer los datos crudos.
+#=============================================================================
+
+# Umbrales (los de las bandas de los gráficos) y nombre de cada nivel
+UMBRALES_DST = [-30, -50, -100, -250]  # nT; el nivel sube al bajar de cada umbral
+NIVELES_DST = ['Débil', 'Moderada', 'Intensa', 'Muy Intensa']
+UMBRALES_KP = [5, 6, 7, 8, 9]
+NIVELES_KP = ['Menor', 'Moderado', 'Fuerte', 'Severo', 'Extremo']
+
+HUECO_MAXIMO = {'Dst': np.timedelta64(3, 'h'), 'Kp': np.timedelta64(3, 'h')}  # Rachas más cercanas se unen
+PASO = {'Dst': np.timedelta64(1, 'h'), 'Kp': np.timedelta64(3, 'h')}  # Resolución de cada índice
+ARCHIVO_CATALOGO = 'tormentas.npy'
+
+# Un registro por tormenta. 'pico' es el instante del mínimo de Dst (o máximo de Kp):
+# la fase principal va de 'inicio' a 'pico' y la recuperación de 'pico' a 'fin' (exclusivo).
+TORMENTA_DTYPE = np.dtype([('indice', 'U3'), ('inicio', 'M8[h]'), ('pico', 'M8[h]'), ('fin', 'M8[h]'),
+                           ('extremo', '<f4'), ('nivel', 'i1')])
+
+
+def _ruta(directorio):
+    directorio = directorio if directorio is not None else data_dir('catalogo')
+    return os.path.join(directorio, ARCHIVO_CATALOGO)
+
+
+def _rachas(en_tormenta, tiempos, hueco):
+    """(inicios, fines) inclusivos de las rachas True; se unen las separadas por <= hueco."""
+    borde = np.diff(np.concatenate(([False], en_tormenta, [False])).astype(np.int8))
+    inicios = np.flatnonzero(borde == 1)
+    fines = np.flatnonzero(borde == -1) - 1
+    if inicios.size > 1:
+        separadas = (tiempos[inicios[1:]] - tiempos[fines[:-1]]) > hueco
+        inicios = inicios[np.concatenate(([True], separadas))]
+        fines = fines[np.concatenate((separadas, [True]))]
+    return inicios, fines
+
+
+def detect_storms(tiempos, valores, indice):
+    """
+    Detecta las tormentas de una serie ('Dst' o 'Kp') y retorna registros TORMENTA_DTYPE.
+
+    Los valores faltantes (NaN) cortan las rachas. Dentro de una racha el extremo es el
+    primer mínimo (Dst) o máximo (Kp); el nivel se asigna con UMBRALES_DST / UMBRALES_KP.
+    """
+    tiempos = np.asarray(tiempos).astype('datetime64[h]')
+    valores = np.asarray(valores, dtype=np.float64)
+    signo = -1.0 if indice == 'Dst' else 1.0
+    umbrales = signo * np.asarray(UMBRALES_DST if indice == 'Dst' else UMBRALES_KP, dtype=np.float64)
+
+    # Se trabaja con 'signo * valor' para que en ambos índices una tormenta sea un valor alto
+    intensidad = np.where(np.isnan(valores), -np.inf, signo * valores)
+    inicios, fines = _rachas(intensidad >= umbrales[0], tiempos, HUECO_MAXIMO[indice])
+    tormentas = np.empty(inicios.size, dtype=TORMENTA_DTYPE)
+    if not inicios.size:
+        return tormentas
+
+    # Extremo de cada racha con reduceat y posición de su primera ocurrencia
+    maximos = np.maximum.reduceat(intensidad, inicios)
+    longitudes = fines - inicios + 1
+    racha = np.repeat(np.arange(inicios.size), longitudes)
+    posiciones = np.arange(longitudes.sum()) + np.repeat(inicios - (np.cumsum(longitudes) - longitudes), longitudes)
+    coincide = intensidad[posiciones] == maximos[racha]
+    _, primero = np.unique(racha[coincide], return_index=True)
+    picos = posiciones[coincide][primero]
+
+    tormentas['indice'] = indice
+    tormentas['inicio'] = tiempos[inicios]
+    tormentas['pico'] = tiempos[picos]
+    tormentas['fin'] = tiempos[fines] + PASO[indice]
+    tormentas['extremo'] = signo * maximos
+    tormentas['nivel'] = np.digitize(maximos, umbrales)
+    return tormentas
+
+
+def _serie_dst(directorio=None):
+    """Toda la serie Dst guardada (desde el primer mes del índice hasta el final del último)."""
+    meses = sorted(dst_store.load_index(directorio))
+    if not meses:
+        return np.empty(0, dtype='datetime64[h]'), np.empty(0)
+    inicio = np.datetime64(meses[0], 'M')
+    fin = np.datetime64(meses[-1], 'M') + 1
+    tiempos, valores = dst_store.read_window(inicio, fin, directorio)
+    return tiempos, valores.astype(np.float64).filled(np.nan)
+
+
+def _serie_kp(directorio=None):
+    cache = gfz_client.load_cache('Kp', 'all', directorio)
+    if cache is None:
+        return np.empty(0, dtype='datetime64[s]'), np.empty(0)
+    return cache[0], cache[1]
+
+
+def build_catalog(directorio=None, directorio_dst=None, directorio_kp=None):
+    """Recorre las series locales, detecta las tormentas y guarda la tabla ordenada. Retorna la tabla."""
+    tormentas = np.concatenate([detect_storms(*_serie_dst(directorio_dst), 'Dst'),
+                                detect_storms(*_serie_kp(directorio_kp), 'Kp')])
+    tormentas = tormentas[np.argsort(tormentas['inicio'], kind='stable')]
+    ruta = _ruta(directorio)
+    temporal = ruta + '.tmp'
+    with open(temporal, 'wb') as archivo:
+        np.save(archivo, tormentas)
+    os.replace(temporal, ruta)
+    return tormentas
+
+
+def load_catalog(directorio=None):
+    """Tabla de tormentas guardada (memory-mapped), o None si aún no se construyó."""
+    ruta = _ruta(directorio)
+    if not os.path.exists(ruta):
+        return None
+    return np.load(ruta, mmap_mode='r')
+
+
+def query(desde=None, hasta=None, indice=None, nivel_minimo=1, directorio=None):
+    """
+    Tormentas que se superponen con [desde, hasta), filtradas por índice y nivel mínimo.
+
+    La tabla está ordenada por 'inicio'; el rango se ubica con searchsorted sobre 'inicio'
+    y sobre el máximo acumulado de 'fin' (que también es monótono).
+    """
+    tormentas = load_catalog(directorio)
+    if tormentas is None:
+        tormentas = build_catalog(directorio)
+    a, b = 0, tormentas.size
+    if hasta is not None:
+        b = np.searchsorted(tormentas['inicio'], np.datetime64(hasta, 'h'), side='left')
+    if desde is not None:
+        a = np.searchsorted(np.maximum.accumulate(tormentas['fin'][:b]), np.datetime64(desde, 'h'), side='right')
+    seleccion = np.asarray(tormentas[a:b])
+    filtro = seleccion['nivel'] >= nivel_minimo
+    if indice is not None:
+        filtro &= seleccion['indice'] == indice
+    return seleccion[filtro]
+
+
+def level_name(tormenta):
+    """Nombre del nivel de un registro del catálogo (p. ej. 'Intensa' o 'Fuerte')."""
+    niveles = NIVELES_DST if tormenta['indice'] == 'Dst' else NIVELES_KP
+    return niveles[int(tormenta['nivel']) - 1]
+
+
+def download_history(desde, hasta=None):
+    """Completa el archivo Dst (mes a mes) y la caché Kp de [desde, hasta) antes de catalogar."""
+    import DST_PLOT_SWP_GRUPO_2 as dst_job  # Solo hace falta al descargar historia
+
+    hasta = hasta or datetime.now(timezone.utc).replace(tzinfo=None)
+    year, month = desde.year, desde.month
+    while datetime(year, month, 1) < hasta:
+        if not dst_store.month_complete(year, month):
+            dst_job.fetch_month(year, month)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    gfz_client.fetch_indices(['Kp'], desde, hasta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Catálogo histórico de tormentas geomagnéticas (Dst y Kp)')
+    parser.add_argument('--descargar', metavar='YYYY-MM-DD', default=None,
+                        help='Descarga antes la historia Dst/Kp desde esta fecha')
+    parser.add_argument('--reconstruir', action='store_true', help='Vuelve a recorrer las series locales')
+    parser.add_argument('--desde', default=None, help='Fecha inicial UTC (yyyy-mm-dd)')
+    parser.add_argument('--hasta', default=None, help='Fecha final UTC, exclusiva (yyyy-mm-dd)')
+    parser.add_argument('--indice', default=None, choices=['Dst', 'Kp'])
+    parser.add_argument('--nivel', type=int, default=1, help='Nivel mínimo (1 = Débil / Menor)')
+    args = parser.parse_args()
+
+    if args.descargar:
+        download_history(datetime.fromisoformat(args.descargar))
+    if args.descargar or args.reconstruir:
+        print(f"Tormentas catalogadas: {build_catalog().size}")
+
+    for tormenta in query(args.desde, args.hasta, args.indice, args.nivel):
+        print(f"{tormenta['indice']:>3}  {tormenta['inicio']}  pico {tormenta['pico']}  fin {tormenta['fin']}  "
+              f"{tormenta['extremo']:7.1f}  {level_name(tormenta)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+# Los módulos pesados (matplotlib, cartopy, netCDF4) se importan una sola vez
+# al arrancar y quedan en memoria para todas las ejecuciones siguientes.
+import matplotlib
+matplotlib.use('Agg')
+
+import DST_PLOT_SWP_GRUPO_2 as dst_job
+import Kp_PLOT_SWP_GRUPO_2 as kp_job
+import PLOT_GLM_INPE_PLOT_SWP_GRUPO_3 as glm_job
+import glm_animation
+from swp_paths import data_dir
+
+#=============================================================================
+# Proceso residente que reemplaza a los workflows de 10/15/60 minutos
+#
+# Cada trabajo tiene su propio intervalo y cada ejecución corre en su propio
+# hilo: el planificador lanza un trabajo en cuanto le toca, aunque otro siga
+# corriendo, así que un servidor lento (Kyoto, GFZ o INPE) no retrasa a los
+# demás. Un trabajo nunca se solapa consigo mismo. Si uno falla, se reintenta
+# con espera exponencial (con jitter) sin afectar el calendario de los demás.
+# El estado de cada trabajo (última ejecución, duración, resultado) se escribe
+# en ~/.cache/swp/daemon/estado.json después de cada ejecución.
+#=============================================================================
+
+TRABAJOS = {
+    # nombre: (función, intervalo en segundos)
+    'dst': (dst_job.update_data, 60 * 60),
+    'kp': (kp_job.update_and_plot, 15 * 60),
+    'glm': (glm_job.main, 10 * 60),
+    'animacion': (glm_animation.update_animation, 10 * 60),
+}
+# Trabajos que se lanzan cuando termina otro (si ambos están activos) en lugar de por su
+# intervalo: la animación corre después del mapa GLM, que ya agregó a la tabla de flashes
+# el archivo que acaba de leer, así que solo descarga los archivos intermedios
+DESPUES_DE = {'animacion': 'glm'}
+ESPERA_BASE = 60  # Primera espera tras un error (segundos); se duplica en cada error seguido
+
+
+def _ahora():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _backoff(intervalo, errores):
+    """Espera antes de reintentar: exponencial con jitter, nunca mayor que el intervalo normal."""
+    espera = min(ESPERA_BASE * 2 ** (errores - 1), intervalo)
+    return espera * random.uniform(0.8, 1.0)
+
+
+def _ejecutar(nombre, funcion, terminados):
+    """Corre un trabajo (en su hilo) y avisa al planificador: (nombre, resultado o excepción, duración)."""
+    inicio = time.monotonic()
+    try:
+        resultado = funcion()
+    except Exception as e:
+        resultado = e
+    terminados.put((nombre, resultado, time.monotonic() - inicio))
+
+
+def _guardar_estado(estado, ruta):
+    temporal = ruta + '.tmp'
+    with open(temporal, 'w') as archivo:
+        json.dump(estado, archivo, indent=1, sort_keys=True)
+    os.replace(temporal, ruta)
+
+
+def run(nombres, una_vez=False):
+    ruta_estado = os.path.join(data_dir('daemon'), 'estado.json')
+    estado = {nombre: {'intervalo': TRABAJOS[nombre][1], 'ejecuciones': 0,
+                       'errores_consecutivos': 0} for nombre in nombres}
+    proxima = {nombre: float('inf') if DESPUES_DE.get(nombre) in nombres else time.monotonic()
+               for nombre in nombres}
+    inicios = {}  # Trabajos en curso: nombre -> instante de inicio (monotonic)
+    terminados = queue.Queue()
+
+    print("Precargando geometrías de cartopy...")
+    glm_job.warm_up()
+    # Aquí las plantillas y los tiles ya quedan en memoria: las regiones se dibujan una tras
+    # otra en este proceso en lugar de pagar el arranque en frío de un worker por región
+    glm_job.RENDER_EN_PROCESOS = False
+
+    while True:
+        # Se lanza cada trabajo que toca y no está corriendo, sin esperar a los demás
+        ahora = time.monotonic()
+        for nombre in nombres:
+            if nombre not in inicios and proxima[nombre] <= ahora:
+                print(f"[{_ahora()}] Ejecutando {nombre}")
+                estado[nombre]['ultimo_inicio'] = _ahora()
+                inicios[nombre] = ahora
+                threading.Thread(target=_ejecutar, args=(nombre, TRABAJOS[nombre][0], terminados),
+                                 name=f'swp-{nombre}', daemon=True).start()
+
+        if una_vez and not inicios:
+            break
+        # Se espera a que termine un trabajo o a que toque el siguiente, lo que ocurra primero
+        esperando = [proxima[nombre] for nombre in nombres
+                     if nombre not in inicios and proxima[nombre] != float('inf')]
+        espera = max(0.0, min(esperando) - time.monotonic()) if esperando else None
+        try:
+            nombre, resultado, duracion = terminados.get(timeout=espera)
+        except queue.Empty:
+            continue
+
+        inicio = inicios.pop(nombre)
+        intervalo = TRABAJOS[nombre][1]
+        info = estado[nombre]
+        if isinstance(resultado, Exception):
+            print(f"Error inesperado en {nombre}: {resultado}")
+        ok = not isinstance(resultado, Exception) and resultado is not False
+        info['ultima_duracion_s'] = round(duracion, 3)
+        info['ejecuciones'] += 1
+        info['ultimo_resultado'] = 'ok' if ok else 'error'
+
+        if ok:
+            info['errores_consecutivos'] = 0
+            info['ultimo_ok'] = info['ultimo_inicio']
+            siguiente = intervalo
+        else:
+            info['errores_consecutivos'] += 1
+            siguiente = _backoff(intervalo, info['errores_consecutivos'])
+        # Si una ejecución dura más que su intervalo, la siguiente arranca apenas termina
+        proxima[nombre] = inicio + siguiente if ok else time.monotonic() + siguiente
+        espera_a_previo = DESPUES_DE.get(nombre) in proxima
+        if una_vez or espera_a_previo:
+            proxima[nombre] = float('inf')
+        for dependiente, anterior in DESPUES_DE.items():
+            if anterior == nombre and dependiente in proxima and dependiente not in inicios:
+                proxima[dependiente] = time.monotonic()
+        info['proxima_en_s'] = None if espera_a_previo else round(siguiente, 1)
+
+        cuando = f"al terminar {DESPUES_DE[nombre]}" if espera_a_previo else f"en {info['proxima_en_s']} s"
+        print(f"[{_ahora()}] {nombre}: {info['ultimo_resultado']} en {info['ultima_duracion_s']} s; "
+              f"próxima {cuando}")
+        _guardar_estado(estado, ruta_estado)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Planificador residente de los gráficos Dst, Kp y GLM')
+    parser.add_argument('--trabajos', default=','.join(TRABAJOS),
+                        help=f"Trabajos separados por comas ({', '.join(TRABAJOS)})")
+    parser.add_argument('--una-vez', action='store_true', help='Ejecuta cada trabajo una vez y termina')
+    args = parser.parse_args()
+    nombres = [nombre.strip() for nombre in args.trabajos.split(',') if nombre.strip()]
+    try:
+        run(nombres, una_vez=args.una_vez)
+    except KeyboardInterrupt:
+        print("Planificador detenido.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import os
+
+#=============================================================================
+# Directorio base para caches y archivos de datos locales. Vive fuera del
+# repositorio (como la caché de teselas de OSM) para que el 'git add .' de los
+# workflows no lo suba. Se puede cambiar con la variable de entorno SWP_DATA_DIR.
+DIRECTORIO_BASE = os.environ.get('SWP_DATA_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'swp'))
+#=============================================================================
+
+def data_dir(*partes):
+    """Retorna (y crea si no existe) un subdirectorio dentro de DIRECTORIO_BASE."""
+    ruta = os.path.join(DIRECTORIO_BASE, *partes)
+    os.makedirs(ruta, exist_ok=True)
+    return ruta
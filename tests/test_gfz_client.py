@@ -0,0 +1,47 @@
+import numpy as np
+
+import gfz_client
+
+
+def _pedir_falso(llamadas):
+    """Reemplazo de gfz_client._pedir: un valor cada 3 horas en [a, b], sin red."""
+    def pedir(index, a, b, status):
+        llamadas.append((a, b))
+        tiempos = np.arange(a, b + np.timedelta64(1, 's'), np.timedelta64(3, 'h'))
+        return tiempos, np.full(len(tiempos), 2.0)
+    return pedir
+
+
+def test_hueco_entre_consultas_se_pide(tmp_path, monkeypatch):
+    llamadas = []
+    monkeypatch.setattr(gfz_client, '_pedir', _pedir_falso(llamadas))
+
+    gfz_client.fetch_indices(['Kp'], '2025-01-01', '2025-01-05', directorio=str(tmp_path))
+    gfz_client.fetch_indices(['Kp'], '2025-01-20', '2025-01-25', directorio=str(tmp_path))
+    llamadas.clear()
+    tiempos, valores = gfz_client.fetch_indices(['Kp'], '2025-01-10', '2025-01-15',
+                                                directorio=str(tmp_path))['Kp']
+
+    assert llamadas == [(np.datetime64('2025-01-10T00:00:00'), np.datetime64('2025-01-15T00:00:00'))]
+    assert len(tiempos) == 41
+    assert tiempos[0] == np.datetime64('2025-01-10T00:00:00')
+    assert tiempos[-1] == np.datetime64('2025-01-15T00:00:00')
+
+    # Ya cubierto: no se vuelve a pedir
+    llamadas.clear()
+    gfz_client.fetch_indices(['Kp'], '2025-01-11', '2025-01-14', directorio=str(tmp_path))
+    assert llamadas == []
+
+
+def test_cola_reciente_se_vuelve_a_pedir(tmp_path, monkeypatch):
+    llamadas = []
+    monkeypatch.setattr(gfz_client, '_pedir', _pedir_falso(llamadas))
+
+    gfz_client.fetch_indices(['Kp'], '2025-01-01', '2025-01-05', directorio=str(tmp_path))
+    llamadas.clear()
+    gfz_client.fetch_indices(['Kp'], '2025-01-01', '2025-01-06', directorio=str(tmp_path))
+
+    assert llamadas == [(np.datetime64('2025-01-04T00:00:00'), np.datetime64('2025-01-06T00:00:00'))]
+    _, _, cubiertos = gfz_client.load_cache('Kp', directorio=str(tmp_path))
+    assert cubiertos.tolist() == [[np.datetime64('2025-01-01T00:00:00').item(),
+                                   np.datetime64('2025-01-06T00:00:00').item()]]
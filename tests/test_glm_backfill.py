@@ -0,0 +1,60 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import glm_backfill
+import swp_paths
+
+LISTADOS = {
+    '/2026/09/': ['GLM_acum5_202609301150.nc', 'GLM_acum5_202609301155.nc'],
+    '/2026/10/': ['GLM_acum5_202610010000.nc'],
+}
+
+
+@pytest.fixture
+def servidor(tmp_path, monkeypatch):
+    """Servidor INPE falso: un listado por mes; los dos meses solo responden si se piden a la vez."""
+    barrera = threading.Barrier(len(LISTADOS), timeout=5)
+
+    class Listado(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in LISTADOS:
+                self.send_error(404)
+                return
+            try:
+                barrera.wait()
+            except threading.BrokenBarrierError:
+                self.send_error(500)
+                return
+            cuerpo = ''.join(f'<a href="{nombre}">{nombre}</a>\n' for nombre in LISTADOS[self.path])
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo.encode())
+
+        def log_message(self, *args):
+            pass
+
+    http = ThreadingHTTPServer(('127.0.0.1', 0), Listado)
+    threading.Thread(target=http.serve_forever, daemon=True).start()
+    monkeypatch.setattr(glm_backfill, 'BASE_URL', f'http://127.0.0.1:{http.server_address[1]}/')
+    monkeypatch.setattr(swp_paths, 'DIRECTORIO_BASE', str(tmp_path))
+    yield
+    http.shutdown()
+    http.server_close()
+
+
+def test_meses_se_listan_a_la_vez(servidor):
+    listados = glm_backfill.list_months([(2026, 9), (2026, 10)])
+
+    assert listados == {(2026, 9): LISTADOS['/2026/09/'], (2026, 10): LISTADOS['/2026/10/']}
+
+
+def test_mes_sin_listado_no_afecta_a_los_demas(servidor):
+    listados = glm_backfill.list_months([(2026, 9), (2026, 11), (2026, 10)])
+
+    assert listados[(2026, 9)] == LISTADOS['/2026/09/']
+    assert listados[(2026, 10)] == LISTADOS['/2026/10/']
+    assert isinstance(listados[(2026, 11)], requests.exceptions.HTTPError)